@@ -0,0 +1,315 @@
+# benchmarks/bench_pricing.py
+"""Бенчмарк движка цен на синтетическом каталоге.
+
+Генерирует во временной папке дерево weapons/ (все восемь категорий), prices.json,
+историю цен и инвентари, подменяет запросы к Steam задержкой и печатает JSON
+с перцентилями задержек и пропускной способностью.
+
+    python benchmarks/bench_pricing.py --skins 5000 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import zlib
+import shutil
+import asyncio
+import argparse
+import platform
+import contextlib
+import tempfile
+import subprocess
+from urllib.parse import quote
+from typing import Dict, Any, List, Tuple
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIES = ["rifles", "pistols", "smgs", "knives", "gloves", "heavy", "shotguns", "snipers"]
+WEARS = ["Factory New", "Minimal Wear", "Field-Tested", "Well-Worn", "Battle-Scarred"]
+MARKET_URL = "https://steamcommunity.com/market/listings/730/"
+
+# ---------- Синтетические данные ----------
+def generate_catalog(root: str, skins: int, weapons_per_category: int, local_ratio: float, rng: random.Random):
+    """Пишет weapons/<категория>/<оружие>.json; возвращает список (item_name, wear, есть ли локальная цена)"""
+    from weapon_catalog import normalize_weapon_name
+
+    weapons = [(category, f"{category.title()} W{i}") for category in CATEGORIES for i in range(weapons_per_category)]
+    per_weapon = max(1, skins // len(weapons))
+
+    items = []
+    for category, weapon in weapons:
+        os.makedirs(os.path.join(root, "weapons", category), exist_ok=True)
+        skin_list = []
+        for j in range(per_weapon):
+            skin_name = f"Skin {j}"
+            links = {}
+            prices = {}
+            for wear in WEARS:
+                links[wear] = MARKET_URL + quote(f"{weapon} | {skin_name} ({wear})")
+                has_local = rng.random() < local_ratio
+                if has_local:
+                    prices[wear] = round(rng.uniform(0.1, 500), 2)
+                items.append((f"{weapon} | {skin_name}", wear, has_local))
+            skin_list.append({"name": skin_name, "links": links, "prices": prices})
+
+        path = os.path.join(root, "weapons", category, normalize_weapon_name(weapon) + ".json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(skin_list, f, ensure_ascii=False)
+    return items
+
+def generate_data_files(root: str, items, history_ratio: float, history_points: int, rng: random.Random):
+    """Пишет data/prices.json и старый data/price_history.json (переносится в SQLite при первом чтении)"""
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    now = time.time()
+
+    prices = {}
+    history = {}
+    for item_name, wear, _ in items:
+        if rng.random() >= history_ratio:
+            continue
+        key = f"{item_name}||{wear}"
+        url = MARKET_URL + quote(f"{item_name} ({wear})")
+        price = rng.uniform(0.1, 500)
+        prices[key] = {
+            "time": now - rng.uniform(0, 3600),
+            "data": {"price_usd": round(price, 4), "url": url, "source": "steam"},
+        }
+
+        points = []
+        for i in range(history_points):
+            price *= rng.uniform(0.95, 1.05)
+            timestamp = now - (history_points - i) * 30 * 24 * 3600 / history_points
+            points.append({"price": round(price, 2), "timestamp": timestamp, "url": url})
+        history[key + "||USD"] = points
+
+    with open(os.path.join(root, "data", "prices.json"), "w", encoding="utf-8") as f:
+        json.dump(prices, f, ensure_ascii=False)
+    with open(os.path.join(root, "data", "price_history.json"), "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False)
+    return len(prices)
+
+def generate_inventories(items, sizes: List[int], rng: random.Random) -> Dict[int, List[Tuple[str, str, int]]]:
+    inventories = {}
+    for size in sizes:
+        sample = rng.sample(items, min(size, len(items)))
+        inventories[size] = [(item_name, wear, rng.randint(1, 3)) for item_name, wear, _ in sample]
+    return inventories
+
+# ---------- Замеры ----------
+def summarize(samples: List[float], operations: int = None) -> Dict[str, Any]:
+    """Перцентили (мс) и пропускная способность по списку длительностей в секундах"""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    total = sum(ordered)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 4)
+
+    operations = len(samples) if operations is None else operations
+    return {
+        "n": len(samples),
+        "total_s": round(total, 6),
+        "ops_per_s": round(operations / total, 2) if total else None,
+        "mean_ms": round(total / len(ordered) * 1000, 4),
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+def timed(func, args_list) -> List[float]:
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def stub_network(latency: float):
+    """Подменяет запросы к Steam: фиксированная задержка и детерминированная цена"""
+    import trade_platform
+    from steam_client import STEAM_CLIENT
+
+    def price_for(market_url):
+        return round(1 + zlib.crc32(market_url.encode()) % 50000 / 100, 2)
+
+    def fetch_steam_price(market_url, currency):
+        time.sleep(latency)
+        return price_for(market_url)
+
+    async def fetch_price(market_url, currency):
+        await asyncio.sleep(latency)
+        return price_for(market_url)
+
+    trade_platform.fetch_steam_price = fetch_steam_price
+    STEAM_CLIENT.fetch_price = fetch_price
+
+def reset_caches(cold_files: bool = True):
+    """Холодный старт: пустой кэш цен и (по желанию) непрочитанные файлы оружия"""
+    import trade_platform
+    import weapon_catalog
+
+    trade_platform.PRICE_CACHE.clear()
+    if cold_files:
+        weapon_catalog.rebuild_index()
+        weapon_catalog.clear_file_cache()
+
+def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench-pricing-")
+    sys.path.insert(0, REPO_DIR)
+    results: Dict[str, Any] = {}
+
+    try:
+        started = time.perf_counter()
+        items = generate_catalog(workdir, args.skins, args.weapons_per_category, args.local_ratio, rng)
+        with_history = generate_data_files(workdir, items, args.history_ratio, args.history_points, rng)
+        inventories = generate_inventories(items, args.inventory_sizes, rng)
+        generation_time = time.perf_counter() - started
+
+        # Пути данных в модулях относительные: работаем из временной папки
+        os.chdir(workdir)
+        import weapon_catalog
+        import trade_platform
+
+        stub_network(args.steam_latency_ms / 1000)
+
+        started = time.perf_counter()
+        index_stats = weapon_catalog.rebuild_index()
+        results["index_build"] = {"files": index_stats["files"], "time_s": round(time.perf_counter() - started, 6)}
+
+        started = time.perf_counter()
+        loaded = trade_platform.load_history_aggregates()
+        results["history_load"] = {"keys": loaded, "time_s": round(time.perf_counter() - started, 6)}
+
+        sample = rng.sample(items, min(args.lookups, len(items)))
+        names = [(item_name, wear) for item_name, wear, _ in sample]
+        weapons = [(trade_platform.parse_item_name(item_name)[0],) for item_name, _ in names]
+        skin_args = [(*trade_platform.parse_item_name(item_name), wear) for item_name, wear in names]
+
+        # find_weapon_file
+        reset_caches()
+        results["find_weapon_file"] = {
+            "cold": summarize(timed(trade_platform.find_weapon_file, weapons)),
+            "warm": summarize(timed(trade_platform.find_weapon_file, weapons)),
+        }
+
+        # get_skin_data_from_file
+        reset_caches()
+        results["get_skin_data_from_file"] = {
+            "cold": summarize(timed(trade_platform.get_skin_data_from_file, skin_args)),
+            "warm": summarize(timed(trade_platform.get_skin_data_from_file, skin_args)),
+        }
+
+        # get_item_price: холодный — промах кэша (локальная цена или Steam), теплый — попадание
+        price_args = [(item_name, wear, "RUB") for item_name, wear in names]
+        reset_caches()
+        results["get_item_price"] = {
+            "cold": summarize(timed(trade_platform.get_item_price, price_args)),
+            "warm": summarize(timed(trade_platform.get_item_price, price_args)),
+            "local_ratio": round(sum(1 for *_, local in sample if local) / len(sample), 4) if sample else 0,
+        }
+
+        # Рост и тренд по истории в памяти
+        growth_args = [(item_name, wear, "RUB", 100.0) for item_name, wear in names]
+        trend_args = [(item_name, wear, "RUB") for item_name, wear in names]
+        results["growth"] = summarize(timed(trade_platform.calculate_growth_from_local_history, growth_args))
+        results["trend"] = summarize(timed(trade_platform.analyze_price_trend, trend_args))
+
+        # Оценка инвентарей целиком
+        results["inventory"] = {}
+        for size, inventory in inventories.items():
+            batch = [(item_name, wear) for item_name, wear, _ in inventory]
+            entry = {}
+            for mode, cold in (("cold", True), ("warm", False)):
+                sync_samples = []
+                async_samples = []
+                if not cold:
+                    trade_platform.get_item_prices(batch, "RUB")
+                for _ in range(args.iterations):
+                    if cold:
+                        reset_caches()
+                    started = time.perf_counter()
+                    trade_platform.get_item_prices(batch, "RUB")
+                    sync_samples.append(time.perf_counter() - started)
+
+                    if cold:
+                        reset_caches()
+                    started = time.perf_counter()
+                    asyncio.run(trade_platform.get_item_prices_async(batch, "RUB"))
+                    async_samples.append(time.perf_counter() - started)
+
+                entry[mode] = summarize(sync_samples, len(batch) * len(sync_samples))
+                entry[mode + "_async"] = summarize(async_samples, len(batch) * len(async_samples))
+            results["inventory"][str(size)] = entry
+
+        results["price_cache"] = trade_platform.get_price_cache_stats()
+        results["catalog"] = weapon_catalog.get_stats()
+
+        return {
+            "meta": {
+                "timestamp": time.time(),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": vars(args),
+                "catalog_items": len(items),
+                "items_with_history": with_history,
+                "generation_time_s": round(generation_time, 3),
+            },
+            "results": results,
+        }
+    finally:
+        # Отложенные записи должны попасть во временную папку, а не в репозиторий
+        if "trade_platform" in sys.modules:
+            import storage
+            trade_platform = sys.modules["trade_platform"]
+            trade_platform.PRICE_CACHE.close()
+            trade_platform.HISTORY_STORE.close()
+            storage.flush_pending()
+        os.chdir(REPO_DIR)
+        if args.keep:
+            print(f"Данные бенчмарка оставлены в {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк получения цен скинов")
+    parser.add_argument("--skins", type=int, default=4000, help="скинов в каталоге (каждый в пяти износах)")
+    parser.add_argument("--weapons-per-category", type=int, default=8)
+    parser.add_argument("--local-ratio", type=float, default=0.7, help="доля износов с локальной ценой")
+    parser.add_argument("--history-ratio", type=float, default=0.3, help="доля предметов с историей цен")
+    parser.add_argument("--history-points", type=int, default=30)
+    parser.add_argument("--inventory-sizes", type=lambda s: [int(x) for x in s.split(",")], default=[10, 100, 1000])
+    parser.add_argument("--lookups", type=int, default=2000, help="предметов в замерах отдельных функций")
+    parser.add_argument("--iterations", type=int, default=5, help="повторов оценки каждого инвентаря")
+    parser.add_argument("--steam-latency-ms", type=float, default=20.0, help="задержка подмененного запроса к Steam")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированные данные")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Модули бота печатают сообщения миграций в stdout: там должен остаться только отчет
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# benchmarks/load_dispatcher.py
+"""Нагрузочный прогон бота без сети.
+
+Поднимает main.dp с поддельной сессией Bot, генерирует синтетический каталог
+(см. bench_pricing) и прогоняет N пользователей по сценариям: /start,
+добавление скинов через AddSkinStates, "Мой инвентарь" с листанием страниц и
+"Обновить цены". Печатает JSON с пропускной способностью, перцентилями задержек
+по шагам и обработчикам и числом исходящих вызовов API.
+
+    python benchmarks/load_dispatcher.py --users 200 --concurrency 50
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import shutil
+import asyncio
+import argparse
+import platform
+import contextlib
+import tempfile
+import itertools
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Tuple
+
+from bench_pricing import REPO_DIR, generate_catalog, generate_data_files, summarize, stub_network, git_commit
+
+# main.py требует токен при импорте; запросы все равно не уходят в сеть
+os.environ.setdefault("TOKEN", "123456:LOAD-TEST-TOKEN")
+
+def make_fake_session(api_latency: float):
+    """Сессия aiogram, которая отвечает на все методы локально и считает вызовы"""
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import SendMessage, EditMessageText
+    from aiogram.types import Message
+
+    class FakeSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.calls = Counter()
+            self.message_ids = itertools.count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            if api_latency:
+                await asyncio.sleep(api_latency)
+
+            if isinstance(method, (SendMessage, EditMessageText)):
+                message_id = getattr(method, "message_id", None) or next(self.message_ids)
+                return Message.model_validate({
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": method.chat_id, "type": "private"},
+                    "text": method.text,
+                }, context={"bot": bot})
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            if False:
+                yield b""
+
+        async def close(self):
+            pass
+
+    return FakeSession()
+
+class LoadRunner:
+    """Прогоняет сценарии пользователей через dp.feed_update и собирает замеры"""
+
+    def __init__(self, main, bot, catalog: List[Tuple[str, str, bool]], args):
+        self.main = main
+        self.bot = bot
+        self.catalog = catalog
+        self.args = args
+
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.steps: Dict[str, List[float]] = defaultdict(list)
+        self.handlers: Dict[str, List[float]] = defaultdict(list)
+        self.errors = Counter()
+
+        async def timing_middleware(handler, event, data):
+            started = time.perf_counter()
+            try:
+                return await handler(event, data)
+            finally:
+                name = data["handler"].callback.__name__
+                self.handlers[name].append(time.perf_counter() - started)
+
+        main.dp.message.middleware(timing_middleware)
+        main.dp.callback_query.middleware(timing_middleware)
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+    def message_update(self, user_id: int, text: str):
+        from aiogram.types import Update
+
+        return Update.model_validate({
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }, context={"bot": self.bot})
+
+    def callback_update(self, user_id: int, data: str):
+        from aiogram.types import Update
+
+        return Update.model_validate({
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.update_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self.message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": self.bot.id, "is_bot": True, "first_name": "Bot"},
+                    "text": "📦 Инвентарь",
+                },
+            },
+        }, context={"bot": self.bot})
+
+    async def feed(self, step: str, update):
+        started = time.perf_counter()
+        try:
+            await self.main.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors[f"{step}: {type(e).__name__}"] += 1
+        self.steps[step].append(time.perf_counter() - started)
+
+    async def send(self, user_id: int, step: str, text: str):
+        await self.feed(step, self.message_update(user_id, text))
+
+    # ---------- Сценарии ----------
+    async def flow_start(self, user_id: int, rng: random.Random):
+        await self.send(user_id, "start", "/start")
+        await self.send(user_id, "inventory_menu", "Инвентарь")
+
+    async def flow_add_skin(self, user_id: int, rng: random.Random):
+        item_name, wear, _ = rng.choice(self.catalog)
+        weapon, skin = item_name.split(" | ", 1)
+        category = rng.choice(list(self.main.CATEGORIES))
+
+        await self.send(user_id, "add_skin:start", "Добавить скин")
+        await self.send(user_id, "add_skin:category", category)
+        await self.send(user_id, "add_skin:weapon", weapon)
+        await self.send(user_id, "add_skin:name", skin)
+        await self.send(user_id, "add_skin:wear", wear)
+        await self.send(user_id, "add_skin:confirm", item_name)
+        await self.send(user_id, "add_skin:amount", str(rng.randint(1, 3)))
+
+    async def flow_inventory(self, user_id: int, rng: random.Random):
+        await self.send(user_id, "show_inventory", "Мой инвентарь")
+        pages = -(-len(self.main.USER_STORE.get_inventory(str(user_id))) // self.main.INVENTORY_PAGE_SIZE)
+        for page in range(1, min(pages, self.args.pages)):
+            await self.feed("inventory_page", self.callback_update(user_id, f"inv:{page}"))
+
+    async def flow_refresh(self, user_id: int, rng: random.Random):
+        await self.send(user_id, "refresh_prices", "Обновить цены")
+
+    async def run_user(self, user_id: int):
+        rng = random.Random(self.args.seed + user_id)
+
+        # Основная часть инвентаря кладется напрямую, через FSM добавляются только --adds скинов
+        for item_name, wear, _ in rng.sample(self.catalog, min(self.args.inventory_size, len(self.catalog))):
+            self.main.USER_STORE.set_item(str(user_id), item_name, wear, rng.randint(1, 3))
+
+        await self.flow_start(user_id, rng)
+        for _ in range(self.args.adds):
+            await self.flow_add_skin(user_id, rng)
+        await self.flow_inventory(user_id, rng)
+        await self.flow_refresh(user_id, rng)
+
+    async def run(self) -> float:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def limited(user_id):
+            async with semaphore:
+                await self.run_user(user_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(1000 + i) for i in range(self.args.users)))
+        return time.perf_counter() - started
+
+async def run_async(args, main, bot, session, catalog) -> Dict[str, Any]:
+    import trade_platform
+
+    trade_platform.load_history_aggregates()
+    runner = LoadRunner(main, bot, catalog, args)
+    wall = await runner.run()
+
+    updates = sum(len(samples) for samples in runner.steps.values())
+    return {
+        "wall_s": round(wall, 3),
+        "updates": updates,
+        "updates_per_s": round(updates / wall, 2) if wall else None,
+        "steps": {step: summarize(samples) for step, samples in sorted(runner.steps.items())},
+        "handlers": {name: summarize(samples) for name, samples in sorted(runner.handlers.items())},
+        "api_calls": dict(session.calls),
+        "api_calls_total": sum(session.calls.values()),
+        "errors": dict(runner.errors),
+        "send_scheduler": main.SEND_SCHEDULER.stats() if args.with_scheduler else None,
+        "price_cache": trade_platform.get_price_cache_stats(),
+        "singleflight": trade_platform.get_singleflight_stats(),
+    }
+
+def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="load-dispatcher-")
+    sys.path.insert(0, REPO_DIR)
+
+    try:
+        catalog = generate_catalog(workdir, args.skins, args.weapons_per_category, args.local_ratio, rng)
+        generate_data_files(workdir, catalog, args.history_ratio, 10, rng)
+
+        # Пути данных в модулях относительные: работаем из временной папки
+        os.chdir(workdir)
+        from aiogram import Bot
+        import main
+
+        # Лог о каждом обработанном апдейте сам по себе заметно тормозит прогон
+        logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+        stub_network(args.steam_latency_ms / 1000)
+        session = make_fake_session(args.api_latency_ms / 1000)
+        if args.with_scheduler:
+            session.middleware(main.SEND_SCHEDULER)
+        bot = Bot(token=os.environ["TOKEN"], session=session)
+        # Обработчики, которые обращаются к глобальному bot, тоже идут в поддельную сессию
+        main.bot = bot
+
+        results = asyncio.run(run_async(args, main, bot, session, catalog))
+        return {
+            "meta": {
+                "timestamp": time.time(),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": vars(args),
+                "catalog_items": len(catalog),
+            },
+            "results": results,
+        }
+    finally:
+        # Отложенные записи должны попасть во временную папку, а не в репозиторий
+        if "main" in sys.modules:
+            import storage
+            import trade_platform
+            trade_platform.PRICE_CACHE.close()
+            trade_platform.HISTORY_STORE.close()
+            sys.modules["main"].USER_STORE.close()
+            storage.flush_pending()
+        os.chdir(REPO_DIR)
+        if args.keep:
+            print(f"Данные прогона оставлены в {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон обработчиков бота")
+    parser.add_argument("--users", type=int, default=100, help="число симулируемых пользователей")
+    parser.add_argument("--concurrency", type=int, default=20, help="сколько пользователей активны одновременно")
+    parser.add_argument("--inventory-size", type=int, default=25, help="скинов в инвентаре до начала сценария")
+    parser.add_argument("--adds", type=int, default=2, help="скинов, добавляемых через AddSkinStates")
+    parser.add_argument("--pages", type=int, default=3, help="сколько страниц инвентаря пролистать")
+    parser.add_argument("--skins", type=int, default=2000)
+    parser.add_argument("--weapons-per-category", type=int, default=8)
+    parser.add_argument("--local-ratio", type=float, default=0.7)
+    parser.add_argument("--history-ratio", type=float, default=0.3)
+    parser.add_argument("--steam-latency-ms", type=float, default=50.0, help="задержка подмененного запроса к Steam")
+    parser.add_argument("--api-latency-ms", type=float, default=5.0, help="задержка подмененного Bot API")
+    parser.add_argument("--with-scheduler", action="store_true", help="пропускать вызовы через SEND_SCHEDULER")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированные данные")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Модули бота печатают сообщения миграций в stdout: там должен остаться только отчет
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
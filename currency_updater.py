@@ -1,86 +1,191 @@
 # currency_updater.py
 import os
-import json
+import time
 import asyncio
+import statistics
 import aiohttp
-from datetime import datetime, time, timedelta
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, List, Optional
 
-EXCHANGE_RATES_FILE = "exchange_rates.json"
+import rates_service
+
+EXCHANGE_RATES_FILE = rates_service.EXCHANGE_RATES_FILE
+
+# Источники курсов (через запятую в RATE_SOURCES); все отвечают в формате {"rates": {...}} с базой USD
+RATE_SOURCES = [
+    url.strip() for url in os.getenv(
+        "RATE_SOURCES",
+        "https://api.exchangerate.host/latest?base=USD,"
+        "https://api.exchangerate-api.com/v4/latest/USD,"
+        "https://open.er-api.com/v6/latest/USD"
+    ).split(",") if url.strip()
+]
+RATE_TIMEOUT = float(os.getenv("RATE_TIMEOUT", "5"))
+RATE_HEDGE_DELAY = float(os.getenv("RATE_HEDGE_DELAY", "1.0"))  # через сколько секунд без ответа подключать следующий источник
+RATE_CROSS_CHECK_WINDOW = float(os.getenv("RATE_CROSS_CHECK_WINDOW", "2.0"))  # сколько ждать остальные источники после первого ответа
+RATE_RETRIES = int(os.getenv("RATE_RETRIES", "3"))
+RATE_RETRY_BACKOFF = float(os.getenv("RATE_RETRY_BACKOFF", "0.5"))
+RATE_OUTLIER_THRESHOLD = 0.05  # отклонение от медианы источников, после которого значение отбрасывается
+RATE_MAX_JUMP = 0.5  # допустимое изменение относительно текущего курса, если источник один
+
+_session: Optional[aiohttp.ClientSession] = None
 
 def load_exchange_rates() -> Dict[str, float]:
-    """Загружает курсы валют из файла"""
-    if not os.path.exists(EXCHANGE_RATES_FILE):
-        # Создаем файл с курсами по умолчанию
-        default_rates = {
-            "RUB": 90.0,
-            "UAH": 38.0,
-            "USD": 1.0,
-            "last_updated": datetime.now().isoformat()
-        }
-        with open(EXCHANGE_RATES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(default_rates, f, ensure_ascii=False, indent=2)
-        return default_rates
-    
-    try:
-        with open(EXCHANGE_RATES_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return {
-                "RUB": data.get("RUB", 90.0),
-                "UAH": data.get("UAH", 38.0),
-                "USD": 1.0
-            }
-    except Exception as e:
-        print(f"Error loading exchange rates: {e}")
-        return {"RUB": 90.0, "UAH": 38.0, "USD": 1.0}
-
-async def fetch_exchange_rates() -> Dict[str, Any]:
-    """Получает актуальные курсы валют с внешнего API"""
+    """Текущие курсы валют из общего снимка"""
+    return rates_service.get_rates()
+
+def _snapshot_to_dict(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    exchange_rates = dict(snapshot["rates"])
+    exchange_rates["last_updated"] = datetime.fromtimestamp(snapshot["updated"]).isoformat() if snapshot["updated"] else None
+    exchange_rates["source"] = snapshot["source"]
+    exchange_rates["version"] = snapshot["version"]
+    return exchange_rates
+
+async def _get_session() -> aiohttp.ClientSession:
+    """Общая сессия для всех обновлений курсов"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=RATE_TIMEOUT))
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def _fetch_source(session: aiohttp.ClientSession, api_url: str, failed: asyncio.Event = None) -> Dict[str, float]:
+    """Запрашивает один источник с повторами и экспоненциальной паузой; о каждой неудаче сообщает через failed"""
+    last_error = None
+    for attempt in range(RATE_RETRIES):
+        try:
+            async with session.get(api_url) as response:
+                if response.status != 200:
+                    raise ValueError(f"HTTP {response.status}")
+                data = await response.json(content_type=None)
+
+            rates = data.get('rates', {})
+            found = {c: float(rates[c]) for c in rates_service.CURRENCY_SYMBOLS if c in rates and c != "USD"}
+            if not found:
+                raise ValueError("в ответе нет нужных валют")
+            return found
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            last_error = e
+            if failed is not None:
+                failed.set()
+            if attempt + 1 < RATE_RETRIES:
+                await asyncio.sleep(RATE_RETRY_BACKOFF * 2 ** attempt)
+
+    raise RuntimeError(f"{api_url}: {last_error}")
+
+def cross_check_rates(results: List[Dict[str, float]], reference: Dict[str, float]) -> Dict[str, float]:
+    """Сводит ответы источников: медиана без выбросов; одиночное значение сверяется с текущим курсом"""
+    combined = {}
+    for currency in rates_service.CURRENCY_SYMBOLS:
+        values = [r[currency] for r in results if r.get(currency, 0) > 0]
+        if not values:
+            continue
+
+        if len(values) >= 2:
+            median = statistics.median(values)
+            agreed = [v for v in values if abs(v - median) / median <= RATE_OUTLIER_THRESHOLD]
+            if agreed:
+                combined[currency] = round(statistics.median(agreed), 6)
+                continue
+            # Источники расходятся (например, их два): берем ближайший к текущему курсу
+            current = reference.get(currency)
+            if not current:
+                continue
+            values = [min(values, key=lambda v: abs(v - current))]
+
+        current = reference.get(currency)
+        if current and abs(values[0] - current) / current > RATE_MAX_JUMP:
+            print(f"⚠️ Курс {currency} отброшен как выброс: {values[0]} (текущий {current})")
+            continue
+        combined[currency] = values[0]
+    return combined
+
+async def fetch_exchange_rates(sources: List[str] = None, session: aiohttp.ClientSession = None) -> Dict[str, Any]:
+    """Получает курсы с нескольких источников параллельно и подменяет общий снимок"""
+    sources = sources or RATE_SOURCES
+    session = session or await _get_session()
+
+    # Хеджирование: следующий источник стартует сразу после неудачной попытки текущих
+    # или если они молчат RATE_HEDGE_DELAY. После первого ответа запускаются все
+    # оставшиеся источники, и их ответы ждутся RATE_CROSS_CHECK_WINDOW для сверки
+    tasks: Dict[asyncio.Future, str] = {}
+    pending = set()
+    results = []
+    used = []
+    failed = asyncio.Event()
+    deadline = None
+
+    def start_next():
+        url = sources[len(tasks)]
+        task = asyncio.ensure_future(_fetch_source(session, url, failed))
+        tasks[task] = url
+        pending.add(task)
+        failed.clear()
+
     try:
-        async with aiohttp.ClientSession() as session:
-            # Пробуем разные API
-            apis = [
-                'https://api.exchangerate.host/latest?base=USD',
-                'https://api.exchangerate-api.com/v4/latest/USD'
-            ]
-            
-            for api_url in apis:
+        start_next()
+        while pending:
+            waiters = set(pending)
+            failed_wait = None
+            if deadline is None:
+                timeout = RATE_HEDGE_DELAY if len(tasks) < len(sources) else None
+                if timeout is not None:
+                    failed_wait = asyncio.ensure_future(failed.wait())
+                    waiters.add(failed_wait)
+            else:
+                timeout = max(0, deadline - time.monotonic())
+
+            try:
+                done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if failed_wait is not None:
+                    failed_wait.cancel()
+
+            for task in done & pending:
+                pending.discard(task)
                 try:
-                    async with session.get(api_url, timeout=10) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            rates = data.get('rates', {})
-                            
-                            exchange_rates = {
-                                "RUB": rates.get('RUB', 90.0),
-                                "UAH": rates.get('UAH', 38.0),
-                                "USD": 1.0,
-                                "last_updated": datetime.now().isoformat(),
-                                "source": api_url
-                            }
-                            
-                            # Сохраняем в файл
-                            with open(EXCHANGE_RATES_FILE, 'w', encoding='utf-8') as f:
-                                json.dump(exchange_rates, f, ensure_ascii=False, indent=2)
-                            
-                            print(f"✅ Курсы валют обновлены: 1 USD = {exchange_rates['RUB']} RUB, {exchange_rates['UAH']} UAH")
-                            return exchange_rates
+                    results.append(task.result())
+                    used.append(tasks[task])
                 except Exception as e:
-                    print(f"❌ Ошибка API {api_url}: {e}")
-                    continue
-                    
-    except Exception as e:
-        print(f"❌ Ошибка при получении курсов валют: {e}")
-    
-    # Возвращаем значения по умолчанию если все API не работают
-    default_rates = {
-        "RUB": 90.0,
-        "UAH": 38.0, 
-        "USD": 1.0,
-        "last_updated": datetime.now().isoformat(),
-        "source": "default"
-    }
-    return default_rates
+                    print(f"❌ Ошибка API {e}")
+
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    break
+            elif results:
+                deadline = time.monotonic() + RATE_CROSS_CHECK_WINDOW
+                while len(tasks) < len(sources):
+                    start_next()
+            elif len(tasks) < len(sources) and (not done or failed.is_set() or not pending):
+                start_next()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if results:
+        combined = cross_check_rates(results, rates_service.get_rates())
+        if combined:
+            # Подменяем снимок в памяти и сохраняем его в файл
+            snapshot = rates_service.set_rates(combined, source=", ".join(used))
+            exchange_rates = _snapshot_to_dict(snapshot)
+
+            print(f"✅ Курсы валют обновлены: 1 USD = " + ", ".join(
+                f"{exchange_rates[c]} {c}" for c in rates_service.CURRENCY_SYMBOLS if c != "USD"
+            ))
+            return exchange_rates
+
+    # Если все источники недоступны, оставляем текущий снимок и явно сообщаем об этом
+    print("⚠️ Не удалось обновить курсы валют, используются сохраненные")
+    exchange_rates = _snapshot_to_dict(rates_service.get_snapshot())
+    exchange_rates["stale"] = True
+    return exchange_rates
 
 async def daily_currency_updater():
     """Ежедневное обновление курсов валют"""
@@ -0,0 +1,120 @@
+# executors.py
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any
+
+import metrics
+
+EXECUTOR_DISK_WORKERS = int(os.getenv("EXECUTOR_DISK_WORKERS", "4"))
+EXECUTOR_DISK_QUEUE = int(os.getenv("EXECUTOR_DISK_QUEUE", "64"))
+EXECUTOR_NETWORK_WORKERS = int(os.getenv("EXECUTOR_NETWORK_WORKERS", "16"))
+EXECUTOR_NETWORK_QUEUE = int(os.getenv("EXECUTOR_NETWORK_QUEUE", "256"))
+BACKPRESSURE_MAX_SLEEP = 0.05  # максимальная пауза асинхронного ожидания свободного места
+
+class BoundedExecutor:
+    """Именованный пул потоков с ограниченной очередью: при переполнении отправитель ждет"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-io")
+        # Места = выполняющиеся + ждущие в очереди задачи
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "queued": 0,
+            "running": 0,
+            "waiting_for_slot": 0,
+            "backpressure_waits": 0,
+        }
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self._stats[key] += delta
+
+    def _call(self, submitted: float, func, args, kwargs):
+        started = time.perf_counter()
+        self._count("queued", -1)
+        self._count("running")
+        metrics.observe(f"executor_{self.name}_wait", started - submitted)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.observe(f"executor_{self.name}_run", time.perf_counter() - started)
+            self._count("running", -1)
+
+    def _done(self, future: Future):
+        self._slots.release()
+        if future.cancelled():
+            # Отмененная задача так и не дошла до _call: снимаем ее с очереди здесь
+            self._count("queued", -1)
+            self._count("cancelled")
+        else:
+            self._count("failed" if future.exception() else "completed")
+
+    def _submit_acquired(self, func, args, kwargs) -> Future:
+        self._count("submitted")
+        self._count("queued")
+        try:
+            future = self._pool.submit(self._call, time.perf_counter(), func, args, kwargs)
+        except BaseException:
+            self._count("queued", -1)
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """Отправка из обычного потока: блокируется, пока очередь заполнена"""
+        if not self._slots.acquire(blocking=False):
+            self._count("backpressure_waits")
+            self._count("waiting_for_slot")
+            try:
+                self._slots.acquire()
+            finally:
+                self._count("waiting_for_slot", -1)
+        return self._submit_acquired(func, args, kwargs)
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет func в пуле; при заполненной очереди корутина ждет, не блокируя цикл событий"""
+        if not self._slots.acquire(blocking=False):
+            self._count("backpressure_waits")
+            self._count("waiting_for_slot")
+            try:
+                delay = 0.001
+                while not self._slots.acquire(blocking=False):
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, BACKPRESSURE_MAX_SLEEP)
+            finally:
+                self._count("waiting_for_slot", -1)
+        return await asyncio.wrap_future(self._submit_acquired(func, args, kwargs))
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = stats["queued"]
+        stats["max_workers"] = self.max_workers
+        stats["max_queue"] = self.max_queue
+        return stats
+
+# Диск (JSON, SQLite, файлы оружия) и сеть (синхронные HTTP-запросы) не делят потоки:
+# долгие запросы к Steam не задерживают чтение настроек и каталога
+DISK_EXECUTOR = BoundedExecutor("disk", EXECUTOR_DISK_WORKERS, EXECUTOR_DISK_QUEUE)
+NETWORK_EXECUTOR = BoundedExecutor("network", EXECUTOR_NETWORK_WORKERS, EXECUTOR_NETWORK_QUEUE)
+
+metrics.register_collector("executor_disk", DISK_EXECUTOR.stats)
+metrics.register_collector("executor_network", NETWORK_EXECUTOR.stats)
+
+async def run_disk(func, *args, **kwargs):
+    return await DISK_EXECUTOR.run(func, *args, **kwargs)
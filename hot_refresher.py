@@ -0,0 +1,126 @@
+# hot_refresher.py
+import os
+import time
+import asyncio
+from typing import Dict, Any, List, Tuple
+
+import trade_platform
+from executors import run_disk
+
+HOT_REFRESH_INTERVAL = float(os.getenv("HOT_REFRESH_INTERVAL", "60"))  # как часто проверять кэш
+HOT_REFRESH_LEAD = float(os.getenv("HOT_REFRESH_LEAD", "120"))  # за сколько секунд до истечения TTL обновлять
+HOT_REFRESH_BUDGET = int(os.getenv("HOT_REFRESH_BUDGET", "40"))  # максимум предметов за один проход
+HOT_REFRESH_RETRY = float(os.getenv("HOT_REFRESH_RETRY", "300"))  # пауза после неудачного запроса, удваивается
+HOT_REFRESH_RETRY_MAX = float(os.getenv("HOT_REFRESH_RETRY_MAX", "21600"))  # потолок паузы (6 часов)
+
+# Неудачные попытки по ключу: (время последней попытки, попыток подряд).
+# Предметы без цены (нет в каталоге, Steam не ответил) не кэшируются, и без этого
+# выбирались бы на каждом проходе, съедая бюджет
+_failures: Dict[str, Tuple[float, int]] = {}
+
+_stats = {
+    "cycles": 0,
+    "refreshed": 0,
+    "skipped_budget": 0,
+    "skipped_backoff": 0,
+    "failed": 0,
+    "errors": 0,
+    "last_cycle": None,
+    "last_duration": 0.0,
+}
+
+def collect_hot_items(inventory: Dict[str, Any]) -> List[Tuple[str, str, int, int]]:
+    """Объединяет инвентари всех пользователей: (name, wear, holders, total_amount)"""
+    items: Dict[Tuple[str, str], List[int]] = {}
+    for user_inv in inventory.values():
+        if not isinstance(user_inv, dict):
+            continue
+        for name, data in user_inv.items():
+            if not isinstance(data, dict):
+                continue
+            entry = items.setdefault((name, data.get("wear")), [0, 0])
+            entry[0] += 1
+            entry[1] += data.get("amount", 1)
+    return [(name, wear, holders, amount) for (name, wear), (holders, amount) in items.items()]
+
+def retry_delay(attempts: int) -> float:
+    """Пауза перед следующей попыткой после attempts неудач подряд"""
+    return min(HOT_REFRESH_RETRY * 2 ** max(0, attempts - 1), HOT_REFRESH_RETRY_MAX)
+
+def rank_hot_items(items, now: float = None, ttl: float = None, lead: float = HOT_REFRESH_LEAD, budget: int = HOT_REFRESH_BUDGET):
+    """Отбирает предметы, у которых скоро истечет кэш, по числу владельцев и стоимости"""
+    now = time.time() if now is None else now
+    ttl = trade_platform.CACHE_TTL if ttl is None else ttl
+
+    due = []
+    backed_off = 0
+    for name, wear, holders, amount in items:
+        key = trade_platform.item_key(name, wear)
+        entry = trade_platform.PRICE_CACHE.get_entry(key)
+        if entry and now - entry["time"] < ttl - lead:
+            continue
+        failure = _failures.get(key)
+        if failure and now - failure[0] < retry_delay(failure[1]):
+            backed_off += 1
+            continue
+        value = entry["data"].get("price_usd", 0) * amount if entry else 0
+        due.append((holders, value, name, wear))
+
+    _stats["skipped_backoff"] += backed_off
+    due.sort(key=lambda entry: (-entry[0], -entry[1]))
+    return [(name, wear) for _, _, name, wear in due[:budget]], max(0, len(due) - budget)
+
+def record_results(selected, results, now: float = None):
+    """Запоминает неудачные попытки (not_found и без цены) и забывает удачные"""
+    now = time.time() if now is None else now
+    for (name, wear), result in zip(selected, results):
+        key = trade_platform.item_key(name, wear)
+        if result and result.get("price") and result.get("source") != "not_found":
+            _failures.pop(key, None)
+            continue
+        _stats["failed"] += 1
+        attempts = _failures.get(key, (0, 0))[1]
+        _failures[key] = (now, attempts + 1)
+
+async def refresh_hot_items(load_inventory) -> int:
+    """Один проход: перезапрашивает самые популярные предметы, чей кэш скоро истечет"""
+    started = time.perf_counter()
+    inventory = await run_disk(load_inventory)
+
+    hot_items = collect_hot_items(inventory)
+    # Неудачи по предметам, которых больше ни у кого нет, не храним
+    held = {trade_platform.item_key(name, wear) for name, wear, _, _ in hot_items}
+    for key in [key for key in _failures if key not in held]:
+        del _failures[key]
+
+    selected, skipped = rank_hot_items(hot_items)
+    if selected:
+        # Кэш хранит цены в USD, поэтому валюта здесь не важна
+        results = await trade_platform.get_item_prices_async(selected, "USD", force_refresh=True)
+        record_results(selected, results)
+
+    _stats["cycles"] += 1
+    _stats["refreshed"] += len(selected)
+    _stats["skipped_budget"] += skipped
+    _stats["last_cycle"] = time.time()
+    _stats["last_duration"] = round(time.perf_counter() - started, 3)
+    return len(selected)
+
+async def run_hot_refresher(load_inventory, interval: float = HOT_REFRESH_INTERVAL):
+    """Фоновая задача, которая держит кэш популярных скинов теплым"""
+    print("🔥 Запуск фонового обновления популярных скинов...")
+
+    while True:
+        try:
+            await refresh_hot_items(load_inventory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"❌ Ошибка в run_hot_refresher: {e}")
+        await asyncio.sleep(interval)
+
+def get_stats() -> Dict[str, Any]:
+    stats = dict(_stats)
+    stats["backoff_keys"] = len(_failures)
+    return stats
@@ -1,8 +1,9 @@
 import os
-import json
 import asyncio
 import logging
 import signal
+import secrets
+import time
 import sys
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, types, F
@@ -11,7 +12,20 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from trade_platform import get_item_price, clear_all_prices_cache
+from trade_platform import (
+    get_item_price_async, iter_item_prices_async, stream_refresh_prices, estimate_inventory_value, flush_price_cache,
+    load_history_aggregates, preload_prices, get_price_cache_stats, get_singleflight_stats
+)
+from steam_client import STEAM_CLIENT
+from hot_refresher import run_hot_refresher, get_stats as get_hot_refresher_stats
+from currency_updater import daily_currency_updater, close_session as close_rates_session
+from storage import safe_load_json, flush_pending, get_stats as get_storage_stats
+from user_store import UserStore
+from weapon_catalog import rebuild_index, get_stats as get_catalog_stats
+from telegram_sender import SEND_SCHEDULER, bulk_sends
+import metrics
+import profiling
+from executors import run_disk
 
 # ---------- Логирование ----------
 logging.basicConfig(level=logging.INFO)
@@ -22,13 +36,34 @@ load_dotenv()
 TOKEN = os.getenv("TOKEN")
 if not TOKEN:
     raise SystemExit("TOKEN not set in .env")
+# Пользователи, которым доступна команда /stats (id через запятую)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()}
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # публичный адрес за обратным прокси, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+# Секрет вебхука: Telegram присылает его в X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
 
 bot = Bot(token=TOKEN)
+# Все исходящие запросы проходят через очередь с лимитами Telegram
+bot.session.middleware(SEND_SCHEDULER)
+# Состояния диалогов, кэш цен (PRICE_CACHE и data/prices.json) и лимиты отправки живут
+# в памяти одного процесса, поэтому бот рассчитан на один экземпляр и в режиме webhook.
+# Несколько экземпляров за одним прокси ломают AddSkinStates/DeleteSkinStates/SettingsStates
+# и перезаписывают data/prices.json друг друга
 dp = Dispatcher(storage=MemoryStorage())
+# Профилирование обработчиков по запросу (PROFILE_HANDLERS или /profile); выключенное — одна проверка
+dp.message.middleware(profiling.handler_middleware)
+dp.callback_query.middleware(profiling.handler_middleware)
 
 # Файлы данных теперь в папке data/
 INVENTORY_FILE = "data/inventory.json"
 USER_SETTINGS_FILE = "data/user_settings.json"
+USER_DB_FILE = "data/users.db"  # инвентари и настройки пользователей
 WEAPON_LIST_FILE = "weapons_list.json"  # Оставляем в корне
 PRICES_FILE = "data/prices.json"
 
@@ -46,37 +81,23 @@ CATEGORIES = {
     "Пулеметы": "heavy"
 }
 CURRENCY_SYMBOL = {"RUB": "₽", "USD": "$", "UAH": "₴", "EUR": "€", "CNY": "¥"}
+INVENTORY_PAGE_SIZE = 10  # скинов на одной странице "Мой инвентарь"
+PROGRESS_EDIT_INTERVAL = 1.0  # не чаще одной правки сообщения с прогрессом в секунду
 
 # ---------- Утилиты ----------
-def safe_load_json(path):
-    if not os.path.exists(path):
-        return {}
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            s = f.read().strip()
-            return json.loads(s) if s else {}
-    except Exception as e:
-        logger.warning("safe_load_json error for %s: %s", path, e)
-        return {}
-
-def safe_save_json(path, data):
-    try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.exception("safe_save_json error for %s: %s", path, e)
-
-def load_inventory():
-    return safe_load_json(INVENTORY_FILE)
-
-def save_inventory(inv):
-    safe_save_json(INVENTORY_FILE, inv)
-
-def load_settings():
-    return safe_load_json(USER_SETTINGS_FILE)
-
-def save_settings(s):
-    safe_save_json(USER_SETTINGS_FILE, s)
+# Инвентари и настройки читаются и пишутся по одному пользователю;
+# старые JSON-файлы импортируются в базу при первом подключении
+USER_STORE = UserStore(USER_DB_FILE, inventory_json=INVENTORY_FILE, settings_json=USER_SETTINGS_FILE)
+
+# Источники текущих значений для /metrics и /stats
+metrics.register_collector("price_cache", get_price_cache_stats)
+metrics.register_collector("singleflight", get_singleflight_stats)
+metrics.register_collector("steam_client", STEAM_CLIENT.stats)
+metrics.register_collector("storage", get_storage_stats)
+metrics.register_collector("weapon_catalog", get_catalog_stats)
+metrics.register_collector("hot_refresher", get_hot_refresher_stats)
+metrics.register_collector("send_scheduler", SEND_SCHEDULER.stats)
+metrics.register_collector("profiling", profiling.get_stats)
 
 def load_weapons_list():
     data = safe_load_json(WEAPON_LIST_FILE)
@@ -97,11 +118,14 @@ WEAPON_LISTS = load_weapons_list()
 
 # Загружаем translations с защитой от ошибок
 try:
-    from translations import TRANSLATIONS
+    from translations import TRANSLATIONS, find_translation
 except ImportError:
     logger.warning("translations.py not found, using empty dict")
     TRANSLATIONS = {}
 
+    def find_translation(weapon, text):
+        return None
+
 # ---------- Клавиатуры ----------
 def main_menu_kb():
     kb = ReplyKeyboardMarkup(
@@ -159,8 +183,8 @@ class SettingsStates(StatesGroup):
 
 # ---------- Async helper ----------
 async def run_blocking(func, *args):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, lambda: func(*args))
+    # Дисковая работа идет в отдельный ограниченный пул, а не в пул цикла по умолчанию
+    return await run_disk(func, *args)
 
 # ---------- Глобальная отмена ----------
 @dp.message(F.text.casefold() == "отмена")
@@ -177,6 +201,36 @@ async def cancel_anywhere(message: types.Message, state: FSMContext):
 async def cmd_start(message: types.Message):
     await message.answer("👋 Привет! Главное меню:", reply_markup=main_menu_kb())
 
+@dp.message(F.text == "/stats")
+async def cmd_stats(message: types.Message):
+    # Команда видна только администраторам, остальным бот не отвечает
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await message.answer(metrics.format_summary()[:4000])
+
+@dp.message(F.text.startswith("/profile"))
+async def cmd_profile(message: types.Message):
+    """/profile handlers|pricing N — профилировать N следующих вызовов; /profile off — выключить"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    args = message.text.split()[1:]
+    if args == ["off"]:
+        profiling.disable()
+    elif len(args) == 2 and args[0] in profiling.TARGETS and args[1].isdigit():
+        profiling.enable(args[0], int(args[1]))
+    elif args:
+        await message.answer("Использование: /profile handlers|pricing N или /profile off")
+        return
+
+    stats = profiling.get_stats()
+    await message.answer(
+        f"🩺 Профилирование: обработчики {stats['remaining_handlers']}, цены {stats['remaining_pricing']}\n"
+        f"Снято профилей: {stats['profiles']}, пропущено (занято): {stats['skipped_busy']}\n"
+        f"Папка: {profiling.PROFILE_DIR}\n"
+        f"Последний: {stats['last_file'] or '—'}"
+    )
+
 # --- Настройки ---
 @dp.message(F.text == "Настройки")
 async def open_settings(message: types.Message, state: FSMContext):
@@ -196,9 +250,10 @@ async def choose_currency(message: types.Message, state: FSMContext):
     if text not in mapping:
         await message.answer("Выберите валюту кнопкой.")
         return
-    settings = load_settings()
-    settings[str(message.from_user.id)] = {"currency": mapping[text]}
-    save_settings(settings)
+    user_id = str(message.from_user.id)
+    settings = USER_STORE.get_settings(user_id)
+    settings["currency"] = mapping[text]
+    USER_STORE.set_settings(user_id, settings)
     await message.answer(f"✅ Валюта установлена: {mapping[text]}", reply_markup=main_menu_kb())
     await state.clear()
 
@@ -208,199 +263,242 @@ async def inventory_menu(message: types.Message):
     await message.answer("📦 Меню инвентаря:", reply_markup=inventory_menu_kb())
 
 # --- Показ инвентаря ---
-@dp.message(F.text == "Мой инвентарь")
-async def show_inventory(message: types.Message):
-    inv = load_inventory()
-    user_id = str(message.from_user.id)
-    user_inv = inv.get(user_id, {})
-    
-    print(f"🔍 Инвентарь пользователя {user_id}: {len(user_inv)} скинов")
-    
-    if not user_inv:
-        await message.answer("Инвентарь пуст.")
-        return
+def format_skin_text(index, name, wear, amount, result, symbol):
+    """Строка скина для страницы инвентаря; возвращает (текст, стоимость позиции)"""
+    header = f"{index}. {name} — {wear} ×{amount} шт."
 
-    settings = load_settings()
-    currency = settings.get(user_id, {}).get("currency", "RUB")
-    symbol = CURRENCY_SYMBOL.get(currency, "₽")
+    if isinstance(result, Exception):
+        return f"{header}\n💰 Ошибка загрузки", 0.0
 
-    # Показываем сообщение о начале загрузки
-    loading_msg = await message.answer(f"🔍 Загружаю {len(user_inv)} скинов...")
+    try:
+        price_num = float(result.get("price")) if result and result.get("price") is not None else None
+    except (TypeError, ValueError):
+        price_num = None
+
+    if price_num is None or price_num <= 0:
+        return f"{header}\n💰 Нет данных", 0.0
+
+    total = round(price_num * amount, 2)
+    skin_text = f"{header}\n💵 {price_num}{symbol}"
+    if amount > 1:
+        skin_text += f" (всего {total}{symbol})"
+
+    # Рост цены (24h/7d/30d)
+    growth = result.get("growth", {})
+    growth_lines = [f"{period}: {growth[period]}" for period in ["24h", "7d", "30d"] if growth.get(period, "N/A") != "N/A"]
+    if growth_lines:
+        skin_text += "\n📊 " + " | ".join(growth_lines)
+
+    # Тренд
+    trend = result.get("trend", {})
+    if trend and trend.get("trend") != "N/A":
+        skin_text += f"\n{trend['trend']} (уверенность: {trend['confidence']})"
+
+    return skin_text, total
+
+class EditThrottle:
+    """Пропускает правку сообщения не чаще одного раза в interval секунд"""
+
+    def __init__(self, interval: float = PROGRESS_EDIT_INTERVAL):
+        self.interval = interval
+        self.last = None
+
+    def ready(self) -> bool:
+        now = time.monotonic()
+        if self.last is None or now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
+
+def load_inventory_page(user_id: str, page: int):
+    """Данные одной страницы инвентаря без цен; None, если инвентарь пуст"""
+    user_inv = USER_STORE.get_inventory(user_id)
+    if not user_inv:
+        return None
+
+    currency = USER_STORE.get_currency(user_id)
+    items_data = [(name, data.get("wear"), data.get("amount", 1)) for name, data in user_inv.items()]
+    pages = (len(items_data) + INVENTORY_PAGE_SIZE - 1) // INVENTORY_PAGE_SIZE
+    page = max(0, min(page, pages - 1))
+    start = page * INVENTORY_PAGE_SIZE
+    return {
+        "items": items_data,
+        "page": page,
+        "pages": pages,
+        "start": start,
+        "page_items": items_data[start:start + INVENTORY_PAGE_SIZE],
+        "currency": currency,
+        "symbol": CURRENCY_SYMBOL.get(currency, "₽"),
+    }
 
-    # Создаем задачи для параллельного получения цен
-    tasks = []
-    items_data = []
-    
-    for name, data in user_inv.items():
-        wear = data.get("wear")
-        amount = data.get("amount", 1)
-        
-        # Создаем задачу для каждого скина
-        task = run_blocking(get_item_price, name, wear, currency)
-        tasks.append(task)
-        items_data.append((name, data, amount))
+def build_inventory_page(view, results):
+    """Текст и клавиатура страницы; скины без результата показываются как загружающиеся"""
+    symbol = view["symbol"]
+    page, pages = view["page"], view["pages"]
+
+    lines = []
+    page_value = 0.0
+    url_buttons = []
+    for offset, (name, wear, amount) in enumerate(view["page_items"]):
+        index = view["start"] + offset + 1
+        if offset not in results:
+            lines.append(f"{index}. {name} — {wear} ×{amount} шт.\n⏳ Загружаю цену...")
+            continue
+
+        result = results[offset]
+        skin_text, total = format_skin_text(index, name, wear, amount, result, symbol)
+        lines.append(skin_text)
+        page_value += total
+
+        url = result.get("url", "") if isinstance(result, dict) else ""
+        if url:
+            url_buttons.append(InlineKeyboardButton(text=f"📤 {index}", url=url))
+
+    # Итог по всему инвентарю считается по кэшу, без запросов цен других страниц
+    total_items = len(view["items"])
+    total_value, known = estimate_inventory_value(view["items"], view["currency"])
+    header = (
+        f"📦 Инвентарь: {total_items} скинов · стр. {page + 1}/{pages}\n"
+        f"💵 Общая стоимость: {total_value}{symbol} ({known}/{total_items} с ценой)\n"
+        f"📄 На странице: {round(page_value, 2)}{symbol}"
+    )
+    text = header + "\n\n" + "\n\n".join(lines)
+
+    keyboard = [url_buttons[i:i + 5] for i in range(0, len(url_buttons), 5)]
+    if pages > 1:
+        keyboard.append([
+            InlineKeyboardButton(text="◀️", callback_data=f"inv:{(page - 1) % pages}"),
+            InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="inv:noop"),
+            InlineKeyboardButton(text="▶️", callback_data=f"inv:{(page + 1) % pages}"),
+        ])
+    kb = InlineKeyboardMarkup(inline_keyboard=keyboard) if keyboard else None
+    return text, kb
+
+async def stream_inventory_page(message: types.Message, view, edit: bool = False):
+    """Показывает страницу сразу с ценами из кэша и дописывает остальные по мере ответа Steam"""
+    results = {}
+    shown = message if edit else None
+    shown_count = -1
+    throttle = EditThrottle()
+
+    async def show():
+        nonlocal shown, shown_count
+        text, kb = build_inventory_page(view, results)
+        try:
+            if shown is None:
+                shown = await message.answer(text, reply_markup=kb)
+            else:
+                # Догрузка цен уступает очередь ответам другим пользователям
+                with bulk_sends():
+                    await shown.edit_text(text, reply_markup=kb)
+            shown_count = len(results)
+        except Exception as e:
+            logger.warning("Inventory page update failed: %s", e)
 
-    # Запускаем ВСЕ запросы ПАРАЛЛЕЛЬНО
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # Удаляем сообщение о загрузке
     try:
-        await bot.delete_message(chat_id=message.chat.id, message_id=loading_msg.message_id)
-    except:
-        pass
+        async for ready in iter_item_prices_async([(name, wear) for name, wear, _ in view["page_items"]], view["currency"]):
+            results.update(ready)
+            if throttle.ready():
+                await show()
+    except Exception as e:
+        logger.exception("Page pricing failed: %s", e)
+        for offset in range(len(view["page_items"])):
+            results.setdefault(offset, e)
 
-    total_value = 0.0
-    updated_count = 0
-    total_items = len(user_inv)
+    # Последнее состояние показывается всегда, даже если правка попала под ограничение частоты
+    if shown_count != len(results):
+        await show()
 
-    # Обрабатываем и показываем результаты
-    for i, (result, (name, data, amount)) in enumerate(zip(results, items_data)):
-        wear = data.get("wear")
-        
-        if isinstance(result, Exception):
-            # Сообщение об ошибке
-            skin_text = f"{name} — {wear} ×{amount} шт.\n💰 Ошибка загрузки"
-            await message.answer(skin_text)
-            continue
+@dp.message(F.text == "Мой инвентарь")
+async def show_inventory(message: types.Message):
+    view = load_inventory_page(str(message.from_user.id), 0)
 
-        if not result or result.get("price") is None:
-            # Сообщение без цены
-            skin_text = f"{name} — {wear} ×{amount} шт.\n💰 Нет данных"
-            
-            # Кнопка "Открыть в Steam"
-            url = result.get("url", "") if result else ""
-            if url:
-                kb = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="📤 Открыть в Steam", url=url)]
-                ])
-                await message.answer(skin_text, reply_markup=kb)
-            else:
-                await message.answer(skin_text)
-            continue
+    if view is None:
+        await message.answer("Инвентарь пуст.")
+        return
 
-        price = result.get("price")
-        url = result.get("url", "")
-        growth = result.get("growth", {})
-        trend = result.get("trend", {})
+    await stream_inventory_page(message, view)
 
-        try:
-            price_num = float(price) if price is not None else None
-        except (TypeError, ValueError):
-            price_num = None
-
-        if price_num is not None and price_num > 0:
-            total = round(price_num * amount, 2)
-            total_value += total
-            price_display = f"💵 {price_num}{symbol}"
-            updated_count += 1
-            
-            # Форматируем информацию о скине
-            skin_text = f"{name} — {wear} ×{amount} шт.\n{price_display}"
-            
-            # ⬇️⬇️⬇️ АНАЛИЗ ЦЕН (24h/7d/30d) ОСТАЕТСЯ ⬇️⬇️⬇️
-            # Добавляем РЕАЛЬНУЮ информацию о росте
-            growth_lines = []
-            for period in ["24h", "7d", "30d"]:
-                if period in growth and growth[period] != "N/A":
-                    growth_value = growth[period]
-                    growth_lines.append(f"{period}: {growth_value}")
-            
-            if growth_lines:
-                skin_text += "\n📊 " + " | ".join(growth_lines)
-            
-            # ⬇️⬇️⬇️ ТРЕНД ОСТАЕТСЯ ⬇️⬇️⬇️
-            if trend and trend.get("trend") != "N/A":
-                skin_text += f"\n{trend['trend']} (уверенность: {trend['confidence']})"
-            
-            # ⬇️⬇️⬇️ ИСТОЧНИКИ УБРАНЫ - ЭТОГО БЛОКА НЕТ ⬇️⬇️⬇️
-            
-            # Отправляем сообщение с кнопкой
-            if url:
-                kb = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="📤 Открыть в Steam", url=url)]
-                ])
-                await message.answer(skin_text, reply_markup=kb)
-            else:
-                await message.answer(skin_text)
+@dp.callback_query(F.data.startswith("inv:"))
+async def inventory_page(callback: types.CallbackQuery):
+    page = callback.data.split(":", 1)[1]
+    if not page.isdigit():
+        await callback.answer()
+        return
+
+    view = load_inventory_page(str(callback.from_user.id), int(page))
+    if view is None:
+        await callback.answer("Инвентарь пуст.")
+        return
+
+    await callback.answer()
+    await stream_inventory_page(callback.message, view, edit=True)
 
-    # Итоговое сообщение
-    if total_value > 0:
-        summary = f"📈 Итог анализа: {updated_count}/{total_items} скинов\n💵 Общая стоимость: {round(total_value, 2)}{symbol}"
-        await message.answer(summary)
-    else:
-        await message.answer(f"📊 Итог: 0/{total_items} скинов с ценами")
-        
 # --- Обновление цен ---
 @dp.message(F.text == "Обновить цены")
 async def refresh_prices(message: types.Message):
     user_id = str(message.from_user.id)
     
-    inv = load_inventory()
-    user_inv = inv.get(user_id, {})
+    user_inv = USER_STORE.get_inventory(user_id)
     
     if not user_inv:
         await message.answer("❌ Инвентарь пуст.", reply_markup=inventory_menu_kb())
         return
     
-    settings = load_settings()
-    currency = settings.get(user_id, {}).get("currency", "RUB")
+    currency = USER_STORE.get_currency(user_id)
     symbol = CURRENCY_SYMBOL.get(currency, "₽")
     
-    # Очищаем кэш для принудительного обновления
-    clear_all_prices_cache()
-    
     total_items = len(user_inv)
     
     # Показываем сообщение о начале обновления
     progress_msg = await message.answer(f"🔄 Начинаю обновление {total_items} скинов...\n⏳ Это займет ~{total_items * 2} секунд")
     
     updated_count = 0
+    processed = 0
     total_value = 0.0
     errors = []
+    refresh_stats = {"refreshed": 0, "fresh": 0}
+    throttle = EditThrottle()
     
-    # Создаем задачи для параллельного выполнения
-    tasks = []
-    items_data = []
+    items_data = [(name, data, data.get("amount", 1)) for name, data in user_inv.items()]
     
-    for name, data in user_inv.items():
-        wear = data.get("wear")
-        amount = data.get("amount", 1)
-        
-        # Создаем задачу для каждого скина
-        task = run_blocking(get_item_price, name, wear, currency, True)
-        tasks.append(task)
-        items_data.append((name, data, amount))
-    
-    # Запускаем ВСЕ запросы ПАРАЛЛЕЛЬНО
+    # Обновляем только скины пользователя, пропуская недавно обновленные;
+    # результаты обрабатываются по мере готовности, а не после самого медленного запроса
     try:
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        stream, refresh_stats = stream_refresh_prices(
+            [(name, data.get("wear"), amount) for name, data, amount in items_data], currency
+        )
         
-        # Обрабатываем результаты
-        for i, (result, (name, data, amount)) in enumerate(zip(results, items_data)):
-            # Обновляем прогресс каждые 5 скинов
-            if i % 5 == 0:
-                try:
-                    await bot.edit_message_text(
-                        chat_id=message.chat.id,
-                        message_id=progress_msg.message_id,
-                        text=f"🔄 Обработано {i}/{total_items} скинов..."
-                    )
-                except:
-                    pass
-            
-            if isinstance(result, Exception):
-                errors.append(f"{name}: {str(result)}")
-                continue
+        async for ready in stream:
+            for index, result in ready:
+                name, data, amount = items_data[index]
+                processed += 1
                 
-            if result and result.get("price"):
-                price = result.get("price")
+                if isinstance(result, Exception):
+                    errors.append(f"{name}: {str(result)}")
+                    continue
+                    
+                if result and result.get("price"):
+                    price = result.get("price")
+                    try:
+                        price_num = float(price) if price is not None else None
+                        if price_num is not None and price_num > 0:
+                            total = round(price_num * amount, 2)
+                            total_value += total
+                            updated_count += 1
+                    except (TypeError, ValueError):
+                        pass
+            
+            # Прогресс правится не чаще раза в PROGRESS_EDIT_INTERVAL и показывает реально готовые скины
+            if processed < total_items and throttle.ready():
                 try:
-                    price_num = float(price) if price is not None else None
-                    if price_num is not None and price_num > 0:
-                        total = round(price_num * amount, 2)
-                        total_value += total
-                        updated_count += 1
-                except (TypeError, ValueError):
+                    with bulk_sends():
+                        await bot.edit_message_text(
+                            chat_id=message.chat.id,
+                            message_id=progress_msg.message_id,
+                            text=f"🔄 Обработано {processed}/{total_items} скинов..."
+                        )
+                except:
                     pass
     
     except Exception as e:
@@ -410,6 +508,8 @@ async def refresh_prices(message: types.Message):
     result_text = f"✅ Обновление завершено!\n\n"
     result_text += f"📊 Обновлено: {updated_count}/{total_items} скинов\n"
     result_text += f"💵 Общая стоимость: {round(total_value, 2)}{symbol}\n"
+    if refresh_stats["fresh"]:
+        result_text += f"⏱ Уже актуальны: {refresh_stats['fresh']}\n"
     
     if errors:
         result_text += f"❌ Ошибок: {len(errors)}\n"
@@ -466,13 +566,7 @@ async def add_enter_name(message: types.Message, state: FSMContext):
     weapon = data.get("weapon", "")
     
     # Ищем совпадение в translations
-    found_translation = None
-    if TRANSLATIONS:
-        for key, translation_data in TRANSLATIONS.items():
-            if (translation_data.get("weapon", "").lower() == weapon.lower() and 
-                any(alias.lower() == text.lower() for alias in translation_data.get("ru", []))):
-                found_translation = translation_data
-                break
+    found_translation = find_translation(weapon, text)
     
     if found_translation:
         # Нашли совпадение, используем английское название
@@ -515,14 +609,13 @@ async def add_choose_wear(message: types.Message, state: FSMContext):
     full_name = f"{weapon} | {skin_name}"
     
     # Получаем текущую цену для отображения
-    settings = load_settings()
     user_id = str(message.from_user.id)
-    currency = settings.get(user_id, {}).get("currency", "RUB")
+    currency = USER_STORE.get_currency(user_id)
     symbol = CURRENCY_SYMBOL.get(currency, "₽")
     
     price_info = ""
     try:
-        item = await run_blocking(get_item_price, full_name, wear, currency)
+        item = await get_item_price_async(full_name, wear, currency)
         if item and item.get("price"):
             price = item.get("price")
             price_info = f"\n$Текущая цена: {price}{symbol}"
@@ -598,22 +691,17 @@ async def add_enter_amount(message: types.Message, state: FSMContext):
         amount = 1
     data = await state.get_data()
     user_id = str(message.from_user.id)
-    inv = load_inventory()
-    if user_id not in inv:
-        inv[user_id] = {}
     name = data.get("name")
     wear = data.get("wear")
-    inv[user_id][name] = {"wear": wear, "amount": amount}
-    save_inventory(inv)
+    USER_STORE.set_item(user_id, name, wear, amount)
     
     # Показываем финальную информацию с ценой
-    settings = load_settings()
-    currency = settings.get(user_id, {}).get("currency", "RUB")
+    currency = USER_STORE.get_currency(user_id)
     symbol = CURRENCY_SYMBOL.get(currency, "₽")
     
     price_info = ""
     try:
-        item = await run_blocking(get_item_price, name, wear, currency)
+        item = await get_item_price_async(name, wear, currency)
         if item and item.get("price"):
             price = item.get("price")
             total_price = round(price * amount, 2)
@@ -630,9 +718,8 @@ async def add_enter_amount(message: types.Message, state: FSMContext):
 # --- Удаление скина ---    
 @dp.message(F.text == "Удалить скин")
 async def delete_start(message: types.Message, state: FSMContext):
-    inv = load_inventory()
     user_id = str(message.from_user.id)
-    user_inv = inv.get(user_id, {})
+    user_inv = USER_STORE.get_inventory(user_id)
     if not user_inv:
         await message.answer("Инвентарь пуст.")
         return
@@ -646,13 +733,8 @@ async def delete_start(message: types.Message, state: FSMContext):
 @dp.message(DeleteSkinStates.choosing_skin)
 async def delete_choose(message: types.Message, state: FSMContext):
     text = message.text.strip()
-    inv = load_inventory()
     user_id = str(message.from_user.id)
-    user_inv = inv.get(user_id, {})
-    if text in user_inv:
-        del user_inv[text]
-        inv[user_id] = user_inv
-        save_inventory(inv)
+    if USER_STORE.delete_item(user_id, text):
         await message.answer(f"✅ Удалено: {text}", reply_markup=inventory_menu_kb())
     else:
         await message.answer("Такого скина нет.", reply_markup=inventory_menu_kb())
@@ -664,24 +746,100 @@ async def go_back(message: types.Message, state: FSMContext):
     await state.clear()
     await message.answer("📦 Меню инвентаря:", reply_markup=inventory_menu_kb())
 
+# ---------- Запуск ----------
+async def start_services():
+    """Общий для обоих режимов запуск: каталог, история, фоновые задачи и метрики"""
+    metrics_runner = await metrics.start_metrics_server() if metrics.METRICS_PORT else None
+
+    catalog = await run_blocking(rebuild_index)
+    logger.info("Weapon catalog indexed: %s files in %ss", catalog["files"], catalog["build_time"])
+    history_keys = await run_blocking(load_history_aggregates)
+    logger.info("Price history aggregates loaded: %s keys", history_keys)
+    # Оценка инвентаря и отбор устаревших цен читают кэш прямо в обработчиках
+    cached_prices = await run_blocking(preload_prices)
+    logger.info("Price cache loaded: %s entries", cached_prices)
+
+    # Популярные скины обновляются в фоне до истечения кэша
+    hot_refresher = asyncio.create_task(run_hot_refresher(USER_STORE.all_inventories))
+    # Курсы валют обновляются раз в сутки и подменяются в памяти
+    currency_updater = asyncio.create_task(daily_currency_updater())
+    return [hot_refresher, currency_updater], metrics_runner
+
+async def stop_services(tasks, metrics_runner):
+    for task in tasks:
+        task.cancel()
+    await STEAM_CLIENT.close()
+    await close_rates_session()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
 # ---------- Polling ----------
 async def run_polling():
+    tasks, metrics_runner = await start_services()
+    # Если раньше бот работал через webhook, getUpdates без его удаления не заработает
+    await bot.delete_webhook(drop_pending_updates=False)
+
     tries = 0
-    while True:
-        try:
-            logger.info("Starting polling...")
-            await dp.start_polling(bot, timeout=30)
-        except Exception as e:
-            tries += 1
-            logger.exception("Polling error: %s", e)
-            wait = min(30, 1 + tries * 2)
-            await asyncio.sleep(wait)
-            continue
-        break
+    try:
+        while True:
+            try:
+                logger.info("Starting polling...")
+                await dp.start_polling(bot, timeout=30)
+            except Exception as e:
+                tries += 1
+                logger.exception("Polling error: %s", e)
+                wait = min(30, 1 + tries * 2)
+                await asyncio.sleep(wait)
+                continue
+            break
+    finally:
+        await stop_services(tasks, metrics_runner)
+
+# ---------- Webhook ----------
+async def run_webhook():
+    """Принимает обновления по HTTP за обратным прокси (один экземпляр, см. комментарий у dp)"""
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    if not WEBHOOK_URL:
+        raise SystemExit("WEBHOOK_URL not set for BOT_MODE=webhook")
+
+    secret = WEBHOOK_SECRET
+    if not secret:
+        # Случайный секрет меняется при каждом запуске и перерегистрируется в Telegram
+        secret = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET not set, using a random secret until restart")
+
+    tasks, metrics_runner = await start_services()
+
+    app = web.Application()
+    # Запросы без верного X-Telegram-Bot-Api-Secret-Token отклоняются с 401;
+    # обработка идет в фоне, поэтому Telegram получает ответ сразу
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        await bot.set_webhook(
+            url=WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("Webhook listening on %s:%s%s for %s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL)
+        await asyncio.Event().wait()
+    finally:
+        # Вебхук не удаляем: пока бот перезапускается, Telegram копит обновления у себя
+        await runner.cleanup()
+        await stop_services(tasks, metrics_runner)
 
 if __name__ == "__main__":
     try:
-        asyncio.run(run_polling())
+        asyncio.run(run_webhook() if BOT_MODE == "webhook" else run_polling())
     except KeyboardInterrupt:
 
         logger.info("Stopped by user")
+    finally:
+        flush_price_cache()
+        flush_pending()
@@ -0,0 +1,187 @@
+# metrics.py
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)  # 0 — HTTP-эндпоинт выключен
+METRICS_PREFIX = "csbot"
+
+# Границы корзин гистограмм в секундах: от долей миллисекунды до запросов к Steam
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами (без хранения отдельных значений)"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины"""
+        snapshot = self.snapshot()
+        if not snapshot["count"]:
+            return None
+        rank = q * snapshot["count"]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), snapshot["counts"]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+_lock = threading.Lock()
+_histograms: Dict[str, Histogram] = {}
+_counters: Dict[str, int] = {}
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def _histogram(stage: str) -> Histogram:
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    return histogram
+
+def observe(stage: str, seconds: float):
+    """Записывает длительность этапа"""
+    _histogram(stage).observe(seconds)
+
+@contextmanager
+def timed(stage: str):
+    """Замеряет длительность блока: with metrics.timed("cache_lookup"): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _histogram(stage).observe(time.perf_counter() - started)
+
+def inc(name: str, value: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def register_collector(name: str, collect: Callable[[], Dict[str, Any]]):
+    """Подключает источник текущих значений (статистику кэша, очередей и т.п.)"""
+    _collectors[name] = collect
+
+def collect_gauges() -> Dict[str, Dict[str, float]]:
+    """Числовые значения всех источников; сбой одного источника не ломает остальные"""
+    gauges = {}
+    for name, collect in list(_collectors.items()):
+        try:
+            values = collect()
+        except Exception as e:
+            print(f"Error collecting metrics {name}: {e}")
+            continue
+        gauges[name] = {
+            key: float(value) for key, value in values.items()
+            if isinstance(value, (int, float))
+        }
+    return gauges
+
+def get_stats() -> Dict[str, Any]:
+    stages = {}
+    for stage, histogram in sorted(_histograms.items()):
+        snapshot = histogram.snapshot()
+        stages[stage] = {
+            "count": snapshot["count"],
+            "avg_ms": round(snapshot["sum"] / snapshot["count"] * 1000, 3) if snapshot["count"] else 0.0,
+            "p50_ms": _ms(histogram.quantile(0.5)),
+            "p99_ms": _ms(histogram.quantile(0.99)),
+        }
+    with _lock:
+        counters = dict(_counters)
+    return {"stages": stages, "counters": counters, "gauges": collect_gauges()}
+
+def _ms(value: Optional[float]):
+    if value is None or value == float("inf"):
+        return value
+    return round(value * 1000, 3)
+
+def _metric_name(*parts: str) -> str:
+    name = "_".join(parts)
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name).lower()
+
+def render_prometheus() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines: List[str] = []
+
+    name = f"{METRICS_PREFIX}_stage_duration_seconds"
+    lines.append(f"# HELP {name} Длительность этапов обработки")
+    lines.append(f"# TYPE {name} histogram")
+    for stage, histogram in sorted(_histograms.items()):
+        snapshot = histogram.snapshot()
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, snapshot["counts"]):
+            cumulative += count
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {snapshot["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {snapshot["sum"]:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {snapshot["count"]}')
+
+    with _lock:
+        counters = dict(_counters)
+    if counters:
+        name = f"{METRICS_PREFIX}_events_total"
+        lines.append(f"# TYPE {name} counter")
+        for event, value in sorted(counters.items()):
+            lines.append(f'{name}{{event="{event}"}} {value}')
+
+    for group, values in sorted(collect_gauges().items()):
+        for key, value in sorted(values.items()):
+            name = _metric_name(METRICS_PREFIX, group, key)
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+def format_summary() -> str:
+    """Короткая сводка для команды /stats"""
+    stats = get_stats()
+    lines = ["📈 Этапы (кол-во · среднее · p50 · p99, мс):"]
+    for stage, values in stats["stages"].items():
+        lines.append(f"• {stage}: {values['count']} · {values['avg_ms']} · {values['p50_ms']} · {values['p99_ms']}")
+    if len(lines) == 1:
+        lines.append("• пока нет замеров")
+
+    gauges = stats["gauges"]
+    cache = gauges.get("price_cache", {})
+    if cache:
+        lines.append(f"\n💾 Кэш цен: {int(cache.get('size', 0))}/{int(cache.get('max_size', 0))}, попаданий {round(cache.get('hit_ratio', 0) * 100, 1)}%")
+    for group, values in sorted(gauges.items()):
+        if "queue_depth" in values:
+            lines.append(f"📬 {group}: очередь {int(values['queue_depth'])}")
+    for event, value in sorted(stats["counters"].items()):
+        lines.append(f"🔢 {event}: {value}")
+    return "\n".join(lines)
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Поднимает HTTP /metrics для Prometheus; возвращает runner для остановки"""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📊 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
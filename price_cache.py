@@ -0,0 +1,166 @@
+# price_cache.py
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from storage import safe_load_json, save_json_coalesced, flush_pending
+
+class PriceCache:
+    """Кэш цен в памяти: LRU с ограничением размера, TTL и отложенной записью на диск через storage"""
+
+    def __init__(self, path: str, max_size: int = 5000, ttl: float = 600, flush_interval: float = 5.0, migrate=None):
+        self.path = path
+        self.migrate = migrate  # migrate(key, entry) -> (key, entry) | None для записей старого формата
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval  # окно, за которое изменения собираются в одну запись
+
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loaded = False
+        self._dirty = False
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "writes": 0,
+            "flushes": 0,
+        }
+
+    # ---------- Загрузка и сохранение ----------
+    def _ensure_loaded(self):
+        """Один раз читает файл кэша с диска"""
+        if self._loaded:
+            return
+        data = safe_load_json(self.path)
+
+        # Самые свежие записи становятся последними в порядке LRU
+        for key, entry in sorted(data.items(), key=lambda kv: kv[1].get("time", 0)):
+            if not isinstance(entry, dict) or "data" not in entry:
+                continue
+            if self.migrate is not None:
+                migrated = self.migrate(key, entry)
+                if migrated != (key, entry):
+                    self._mark_dirty()
+                if migrated is None:
+                    continue
+                key, entry = migrated
+            self._entries[key] = entry
+        self._loaded = True
+        self._evict()
+
+    def load(self) -> int:
+        """Читает файл кэша заранее; возвращает число записей"""
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """Снимок для записи на диск; storage снимает его в момент записи"""
+        with self._lock:
+            self._dirty = False
+            self._stats["flushes"] += 1
+            return dict(self._entries)
+
+    def _mark_dirty(self):
+        """Отмечает изменения: серия изменений за flush_interval станет одной записью"""
+        self._dirty = True
+        save_json_coalesced(self.path, self._snapshot, self.flush_interval)
+
+    def flush(self) -> bool:
+        """Сразу записывает отложенные изменения на диск"""
+        return flush_pending(self.path) > 0
+
+    def close(self):
+        """Сбрасывает изменения на диск"""
+        self.flush()
+
+    # ---------- Операции с кэшем ----------
+    def _evict(self):
+        evicted = 0
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            evicted += 1
+        if evicted:
+            self._stats["evictions"] += evicted
+            self._mark_dirty()
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """Возвращает запись {"time", "data"} без проверки TTL и без учета в статистике"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._entries.get(key)
+
+    def get(self, key: str, now: float = None) -> Optional[Dict[str, Any]]:
+        """Возвращает данные из кэша, если запись не старше TTL"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if now - entry.get("time", 0) >= self.ttl:
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry["data"]
+
+    def set(self, key: str, data: Dict[str, Any], now: float = None):
+        """Кладет данные в кэш; на диск они попадут при следующем сбросе"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[key] = {"time": now, "data": data}
+            self._entries.move_to_end(key)
+            self._stats["writes"] += 1
+            self._mark_dirty()
+            self._evict()
+
+    def set_many(self, items: Dict[str, Dict[str, Any]], now: float = None):
+        """Кладет пачку записей в кэш под одной блокировкой"""
+        if not items:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            for key, data in items.items():
+                self._entries[key] = {"time": now, "data": data}
+                self._entries.move_to_end(key)
+            self._stats["writes"] += len(items)
+            self._mark_dirty()
+            self._evict()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            if self._entries.pop(key, None) is None:
+                return False
+            self._mark_dirty()
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._mark_dirty()
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий, промахов и вытеснений"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["max_size"] = self.max_size
+            stats["dirty"] = self._dirty
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
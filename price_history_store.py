@@ -0,0 +1,206 @@
+# price_history_store.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    price REAL NOT NULL,
+    url TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_history_key_ts ON history (key, timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class PriceHistoryStore:
+    """История цен в SQLite: дозапись точек, групповые транзакции и выборки по диапазону"""
+
+    def __init__(self, path: str, legacy_json: str = None, max_points: int = 100, migrate_key=None, keys_version: int = 1):
+        self.path = path
+        self.legacy_json = legacy_json
+        self.max_points = max_points
+        self.migrate_key = migrate_key  # migrate_key(key) -> (new_key, price_factor) | None
+        self.keys_version = keys_version  # при смене формата ключей миграция проходит еще раз
+
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ---------- Подключение ----------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+        self._import_legacy_json()
+        self._migrate_keys()
+        return conn
+
+    def _import_legacy_json(self):
+        """Однократно переносит историю из старого price_history.json"""
+        if not self.legacy_json or not os.path.exists(self.legacy_json):
+            return
+        conn = self._conn
+        if conn.execute("SELECT 1 FROM meta WHERE name = 'legacy_json_imported'").fetchone():
+            return
+
+        try:
+            with open(self.legacy_json, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Error loading {self.legacy_json}: {e}")
+            return
+
+        rows = []
+        for key, points in legacy.items():
+            for point in points[-self.max_points:]:
+                try:
+                    rows.append((key, float(point["timestamp"]), float(point["price"]), point.get("url", "")))
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+        with conn:
+            conn.executemany("INSERT INTO history (key, timestamp, price, url) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('legacy_json_imported', ?)", (str(time.time()),))
+        print(f"✅ История цен перенесена в {self.path}: {len(rows)} записей")
+
+    def _migrate_keys(self):
+        """Переименовывает ключи старого формата и пересчитывает цены (один раз на версию формата)"""
+        if self.migrate_key is None:
+            return
+        conn = self._conn
+        row = conn.execute("SELECT value FROM meta WHERE name = 'keys_version'").fetchone()
+        if row is not None:
+            migrated_version = int(row[0])
+        else:
+            # До версий формата ключей миграция отмечалась флагом keys_migrated
+            migrated_version = 1 if conn.execute("SELECT 1 FROM meta WHERE name = 'keys_migrated'").fetchone() else 0
+        if migrated_version >= self.keys_version:
+            return
+
+        renamed = set()
+        with conn:
+            for (key,) in conn.execute("SELECT DISTINCT key FROM history").fetchall():
+                migrated = self.migrate_key(key)
+                if migrated is None:
+                    continue
+                new_key, factor = migrated
+                conn.execute("UPDATE history SET key = ?, price = price * ? WHERE key = ?", (new_key, factor, key))
+                renamed.add(new_key)
+            self._prune(conn, renamed)
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('keys_migrated', ?)", (str(time.time()),))
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('keys_version', ?)", (str(self.keys_version),))
+        if renamed:
+            print(f"✅ Ключи истории цен переведены в новый формат: {len(renamed)}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------- Запись ----------
+    def _prune(self, conn: sqlite3.Connection, keys: Iterable[str]):
+        """Оставляет только последние max_points записей по каждому ключу"""
+        if not self.max_points:
+            return
+        for key in keys:
+            conn.execute(
+                "DELETE FROM history WHERE id IN "
+                "(SELECT id FROM history WHERE key = ? ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?)",
+                (key, self.max_points)
+            )
+
+    def append_many(self, points: Iterable[Tuple[str, float, float, str]]) -> int:
+        """Дописывает точки (key, timestamp, price, url) одной транзакцией"""
+        rows = [(key, float(ts), float(price), url or "") for key, ts, price, url in points]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT INTO history (key, timestamp, price, url) VALUES (?, ?, ?, ?)", rows)
+                self._prune(conn, {row[0] for row in rows})
+        return len(rows)
+
+    def append(self, key: str, price: float, url: str = "", timestamp: float = None) -> int:
+        """Дописывает одну точку истории"""
+        timestamp = time.time() if timestamp is None else timestamp
+        return self.append_many([(key, timestamp, price, url)])
+
+    # ---------- Чтение ----------
+    def range(self, key: str, since: float = None, until: float = None, limit: int = None) -> List[Dict[str, Any]]:
+        """Возвращает точки по ключу в интервале [since, until] по возрастанию времени"""
+        query = "SELECT timestamp, price, url FROM history WHERE key = ?"
+        params: List[Any] = [key]
+        if since is not None:
+            query += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND timestamp <= ?"
+            params.append(until)
+
+        if limit:
+            # Берем последние limit точек, но отдаем в хронологическом порядке
+            inner = query.replace("SELECT timestamp, price, url", "SELECT id, timestamp, price, url", 1)
+            query = (
+                f"SELECT timestamp, price, url FROM ({inner} ORDER BY timestamp DESC, id DESC LIMIT ?)"
+                " ORDER BY timestamp ASC, id ASC"
+            )
+            params.append(limit)
+        else:
+            query += " ORDER BY timestamp ASC, id ASC"
+
+        with self._lock:
+            rows = self._connect().execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest(self, key: str, count: int = 1) -> List[Dict[str, Any]]:
+        """Последние count точек по ключу"""
+        return self.range(key, limit=count)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            row = self._connect().execute("SELECT COUNT(*) FROM history WHERE key = ?", (key,)).fetchone()
+        return row[0]
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            rows = self._connect().execute("SELECT DISTINCT key FROM history").fetchall()
+        return [row[0] for row in rows]
+
+    def recent_by_key(self, count: int = 10) -> Dict[str, Dict[str, Any]]:
+        """Для всех ключей: число точек и последние count точек (для прогрева агрегатов)"""
+        query = (
+            "SELECT key, timestamp, price, total FROM ("
+            " SELECT id, key, timestamp, price,"
+            " ROW_NUMBER() OVER (PARTITION BY key ORDER BY timestamp DESC, id DESC) AS rn,"
+            " COUNT(*) OVER (PARTITION BY key) AS total"
+            " FROM history"
+            ") WHERE rn <= ? ORDER BY key, timestamp ASC, id ASC"
+        )
+        with self._lock:
+            rows = self._connect().execute(query, (count,)).fetchall()
+
+        result: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            entry = result.setdefault(row["key"], {"count": row["total"], "points": []})
+            entry["points"].append({"timestamp": row["timestamp"], "price": row["price"]})
+        return result
@@ -0,0 +1,160 @@
+# profiling.py
+import os
+import io
+import time
+import pstats
+import inspect
+import cProfile
+import functools
+import threading
+from typing import Dict, Any, Optional
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "30"))  # строк в текстовой сводке
+TARGETS = ("handlers", "pricing")
+
+# Сколько следующих вызовов профилировать по каждой цели; 0 — выключено
+_remaining: Dict[str, int] = {target: int(os.getenv(f"PROFILE_{target.upper()}", "0") or 0) for target in TARGETS}
+_lock = threading.Lock()
+_active = False  # cProfile в одном потоке не вкладывается, поэтому профиль снимается по одному
+_active_thread = None  # поток снимаемого профиля: вызовы из него уже попадают в профиль
+_stats = {"profiles": 0, "skipped_busy": 0, "last_file": None}
+
+def enable(target: str, count: int):
+    """Профилировать следующие count вызовов цели (handlers или pricing)"""
+    if target not in TARGETS:
+        raise ValueError(f"неизвестная цель профилирования: {target}")
+    with _lock:
+        _remaining[target] = max(0, count)
+
+def disable():
+    with _lock:
+        for target in TARGETS:
+            _remaining[target] = 0
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats.update({f"remaining_{target}": count for target, count in _remaining.items()})
+    return stats
+
+def _start(target: str) -> Optional[cProfile.Profile]:
+    """Занимает профилировщик, если по цели остались вызовы и другой профиль не снимается"""
+    global _active, _active_thread
+    with _lock:
+        if not _remaining[target]:
+            return None
+        if _active:
+            # Вложенный вызов (поток цен внутри обновления) уже профилируется внешним
+            if _active_thread != threading.get_ident():
+                _stats["skipped_busy"] += 1
+            return None
+        _remaining[target] -= 1
+        _active = True
+        _active_thread = threading.get_ident()
+
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+def _finish(profile: cProfile.Profile, target: str, name: str, elapsed: float):
+    global _active, _active_thread
+    profile.disable()
+    with _lock:
+        _active = False
+        _active_thread = None
+
+    # Файлы пишутся в отдельном потоке: профилируемый обработчик не держит цикл событий
+    threading.Thread(target=_save, args=(profile, target, name, elapsed), name="profile-dump", daemon=True).start()
+
+def _save(profile: cProfile.Profile, target: str, name: str, elapsed: float):
+    try:
+        path = dump(profile, target, name, elapsed)
+        with _lock:
+            _stats["profiles"] += 1
+            _stats["last_file"] = path
+    except Exception as e:
+        print(f"Error saving profile {name}: {e}")
+
+def dump(profile: cProfile.Profile, target: str, name: str, elapsed: float) -> str:
+    """Пишет .prof и рядом текстовую сводку топ-PROFILE_TOP функций по накопленному времени"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}"
+    base = os.path.join(PROFILE_DIR, f"{stamp}-{target}-{name}")
+
+    profile.dump_stats(base + ".prof")
+
+    out = io.StringIO()
+    out.write(f"{target}: {name}, {elapsed * 1000:.1f} ms\n\n")
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+    return base + ".prof"
+
+def profiled(target: str):
+    """Декоратор: профилирует вызов, если цель включена; иначе — одна проверка словаря"""
+    def decorator(func):
+        name = func.__name__
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            def asyncgen_wrapper(*args, **kwargs):
+                if not _remaining[target]:
+                    return func(*args, **kwargs)
+                return profile_asyncgen(target, name, func(*args, **kwargs))
+            return asyncgen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _remaining[target]:
+                    return await func(*args, **kwargs)
+                return await profile_async(target, name, func(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _remaining[target]:
+                return func(*args, **kwargs)
+            profile = _start(target)
+            if profile is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _finish(profile, target, name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+async def profile_async(target: str, name: str, awaitable):
+    """Профилирует корутину целиком (включая то, что цикл событий выполняет во время ее ожиданий)"""
+    profile = _start(target)
+    if profile is None:
+        return await awaitable
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        _finish(profile, target, name, time.perf_counter() - started)
+
+async def profile_asyncgen(target: str, name: str, agen):
+    """Профилирует асинхронный генератор от первой пачки до исчерпания или закрытия"""
+    profile = _start(target)
+    started = time.perf_counter()
+    try:
+        async for item in agen:
+            yield item
+    finally:
+        try:
+            # Потребитель мог бросить поток: закрываем исходный генератор, чтобы отработал его finally
+            await agen.aclose()
+        finally:
+            if profile is not None:
+                _finish(profile, target, name, time.perf_counter() - started)
+
+async def handler_middleware(handler, event, data):
+    """Middleware aiogram: профилирует обработчики, пока включена цель handlers"""
+    if not _remaining["handlers"]:
+        return await handler(event, data)
+    return await profile_async("handlers", data["handler"].callback.__name__, handler(event, data))
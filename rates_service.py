@@ -0,0 +1,73 @@
+# rates_service.py
+import os
+import time
+import threading
+from typing import Dict, Any
+
+from storage import safe_load_json, save_json_coalesced
+
+EXCHANGE_RATES_FILE = "data/exchange_rates.json"
+LEGACY_RATES_FILE = "exchange_rates.json"  # раньше currency_updater писал сюда (в текущую папку)
+
+# валюты и их символы
+CURRENCY_SYMBOLS = {"USD": "$", "RUB": "₽", "UAH": "₴", "EUR": "€", "CNY": "¥"}
+DEFAULT_RATES = {"RUB": 90.0, "UAH": 38.0, "EUR": 0.92, "CNY": 7.2, "USD": 1.0}
+
+# Снимок курсов неизменяем: обновление собирает новый и подменяет ссылку целиком
+_snapshot: Dict[str, Any] = None
+_update_lock = threading.Lock()
+
+def _build_snapshot(rates: Dict[str, float], version: int, updated: float, source: str) -> Dict[str, Any]:
+    merged = dict(DEFAULT_RATES)
+    for currency in CURRENCY_SYMBOLS:
+        try:
+            value = float(rates.get(currency, merged[currency]))
+        except (TypeError, ValueError):
+            continue
+        if value > 0:
+            merged[currency] = value
+    merged["USD"] = 1.0
+    return {"rates": merged, "version": version, "updated": updated, "source": source}
+
+def _load_snapshot() -> Dict[str, Any]:
+    """Читает курсы с диска один раз при первом обращении"""
+    global _snapshot
+
+    with _update_lock:
+        if _snapshot is None:
+            path = EXCHANGE_RATES_FILE if os.path.exists(EXCHANGE_RATES_FILE) else LEGACY_RATES_FILE
+            data = safe_load_json(path)
+            updated = data.get("last_updated", 0)
+            if not isinstance(updated, (int, float)):
+                updated = 0
+            _snapshot = _build_snapshot(data, 0, updated, data.get("source", "file" if data else "default"))
+        return _snapshot
+
+def get_snapshot() -> Dict[str, Any]:
+    """Текущий снимок: {"rates", "version", "updated", "source"}"""
+    return _snapshot or _load_snapshot()
+
+def get_rates() -> Dict[str, float]:
+    """Курсы к USD для всех валют из CURRENCY_SYMBOLS (без обращения к диску)"""
+    return dict(get_snapshot()["rates"])
+
+def set_rates(rates: Dict[str, float], source: str = "manual", persist: bool = True) -> Dict[str, Any]:
+    """Атомарно подменяет снимок курсов и откладывает его запись в EXCHANGE_RATES_FILE"""
+    global _snapshot
+
+    get_snapshot()
+    with _update_lock:
+        current = _snapshot
+        # Валюты, которых нет в новых данных, берем из текущего снимка
+        base = dict(current["rates"])
+        base.update({k: v for k, v in rates.items() if k in CURRENCY_SYMBOLS and v})
+        snapshot = _build_snapshot(base, current["version"] + 1, time.time(), source)
+        _snapshot = snapshot
+
+        if persist:
+            data = dict(snapshot["rates"])
+            data["last_updated"] = snapshot["updated"]
+            data["source"] = source
+            # В очередь под той же блокировкой: порядок записей совпадает с порядком версий
+            save_json_coalesced(EXCHANGE_RATES_FILE, data)
+    return snapshot
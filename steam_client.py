@@ -0,0 +1,116 @@
+# steam_client.py
+import os
+import time
+import asyncio
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+
+STEAM_PRICE_URL = "https://steamcommunity.com/market/priceoverview/"
+STEAM_TIMEOUT = float(os.getenv("STEAM_TIMEOUT", "10"))
+STEAM_MAX_CONCURRENCY = int(os.getenv("STEAM_MAX_CONCURRENCY", "8"))
+STEAM_MIN_INTERVAL = float(os.getenv("STEAM_MIN_INTERVAL", "0.25"))  # минимум секунд между запросами к одному хосту
+
+CURRENCY_CODES = {"USD": 1, "RUB": 5, "UAH": 18, "EUR": 3, "CNY": 23}
+
+def market_hash_from_url(market_url: str) -> Optional[str]:
+    """Достает market_hash_name из ссылки на листинг"""
+    if "/market/listings/730/" not in market_url:
+        return None
+    return market_url.split("/market/listings/730/")[1]
+
+def build_price_url(market_hash: str, currency: str) -> str:
+    code = CURRENCY_CODES.get(currency, 1)
+    return f"{STEAM_PRICE_URL}?currency={code}&appid=730&market_hash_name={market_hash}"
+
+def parse_price_response(data: Dict[str, Any]) -> Optional[float]:
+    """Разбирает ответ priceoverview в число"""
+    if data.get("success") and "lowest_price" in data:
+        price_str = data["lowest_price"]
+        clean = price_str.replace("$", "").replace("₽", "").replace("₴", "").replace("€", "").replace("¥", "").replace("р.", "").replace(",", ".").strip()
+        return float(clean)
+    return None
+
+class SteamMarketClient:
+    """Асинхронный клиент Steam Market с общим пулом соединений и ограничением частоты"""
+
+    def __init__(self, max_concurrency: int = STEAM_MAX_CONCURRENCY, min_interval: float = STEAM_MIN_INTERVAL, timeout: float = STEAM_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.timeout = timeout
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_next: Dict[str, float] = {}
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "throttled": 0,
+        }
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.max_concurrency,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _wait_for_host(self, host: str):
+        """Выдерживает минимальный интервал между запросами к одному хосту"""
+        if self.min_interval <= 0:
+            return
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = self._host_next.get(host, 0) - time.monotonic()
+            if delay > 0:
+                self._stats["throttled"] += 1
+                await asyncio.sleep(delay)
+            self._host_next[host] = time.monotonic() + self.min_interval
+
+    async def get_json(self, url: str) -> Optional[Dict[str, Any]]:
+        session = await self._get_session()
+        async with self._semaphore:
+            await self._wait_for_host(urlsplit(url).netloc)
+            self._stats["requests"] += 1
+            async with session.get(url) as resp:
+                return await resp.json(content_type=None)
+
+    async def fetch_price(self, market_url: str, currency: str = "USD") -> Optional[float]:
+        """Получает цену с Steam Market по URL"""
+        try:
+            market_hash = market_hash_from_url(market_url)
+            if market_hash:
+                with metrics.timed("steam_fetch"):
+                    data = await self.get_json(build_price_url(market_hash, currency))
+                if data:
+                    return parse_price_response(data)
+        except Exception as e:
+            self._stats["errors"] += 1
+            metrics.inc("steam_fetch_errors")
+            print(f"Error fetching Steam price: {e}")
+        return None
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["max_concurrency"] = self.max_concurrency
+        stats["min_interval"] = self.min_interval
+        return stats
+
+STEAM_CLIENT = SteamMarketClient()
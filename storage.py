@@ -0,0 +1,184 @@
+# storage.py
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+from typing import Dict, Any, Tuple
+
+COALESCE_INTERVAL = float(os.getenv("STORAGE_COALESCE_INTERVAL", "1.0"))  # секунд между записями одного файла
+
+_locks_guard = threading.Lock()
+_path_locks: Dict[str, threading.Lock] = {}
+
+_pending_lock = threading.Lock()
+# абсолютный путь -> (срок записи, номер сохранения, данные): байты или функция, снимающая данные в момент записи
+_pending: Dict[str, Tuple[float, int, Any]] = {}
+_save_seq = 0
+_flush_lock = threading.Lock()  # записи по очереди: более старый снимок не перезапишет новый
+_flusher = None
+_flusher_wakeup = threading.Event()
+
+_stats = {
+    "loads": 0,
+    "saves": 0,
+    "writes": 0,
+    "bytes_written": 0,
+    "saves_coalesced": 0,
+    "errors": 0,
+}
+
+def _path_lock(path: str) -> threading.Lock:
+    path = os.path.abspath(path)
+    with _locks_guard:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.Lock()
+        return lock
+
+def safe_load_json(path):
+    """Читает JSON; несохраненные отложенные данные имеют приоритет над диском"""
+    with _pending_lock:
+        pending = _pending.get(os.path.abspath(path))
+    if pending is not None:
+        data = pending[2]
+        return json.loads(data if isinstance(data, bytes) else _serialize(data()))
+
+    if not os.path.exists(path):
+        return {}
+    try:
+        with _path_lock(path):
+            with open(path, "r", encoding="utf-8") as f:
+                s = f.read().strip()
+        _stats["loads"] += 1
+        return json.loads(s) if s else {}
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return {}
+
+def _serialize(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+def _write_atomic(path: str, payload: bytes) -> int:
+    """Пишет во временный файл рядом и атомарно подменяет им целевой"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(payload)
+
+def _save(path, payload: bytes) -> bool:
+    try:
+        with _path_lock(path):
+            written = _write_atomic(path, payload)
+        _stats["writes"] += 1
+        _stats["bytes_written"] += written
+        return True
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"Error saving {path}: {e}")
+        return False
+
+def safe_save_json(path, data) -> bool:
+    """Сразу и атомарно сохраняет JSON (запись под блокировкой файла)"""
+    _stats["saves"] += 1
+    try:
+        payload = _serialize(data)
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"Error saving {path}: {e}")
+        return False
+    return _save(path, payload)
+
+def save_json_coalesced(path, data, interval: float = None):
+    """Откладывает запись: серия сохранений одного файла превращается в одну запись за интервал.
+    data может быть функцией без аргументов: тогда данные снимаются в момент записи"""
+    global _flusher, _save_seq
+
+    if not callable(data):
+        # Снимок делается сразу, чтобы последующие изменения объекта не попали в запись
+        data = _serialize(data)
+    path = os.path.abspath(path)
+    due = time.monotonic() + (COALESCE_INTERVAL if interval is None else interval)
+
+    with _pending_lock:
+        _stats["saves"] += 1
+        _save_seq += 1
+        pending = _pending.get(path)
+        if pending is not None:
+            _stats["saves_coalesced"] += 1
+            # Новые сохранения не откладывают уже назначенную запись
+            due = min(due, pending[0])
+        _pending[path] = (due, _save_seq, data)
+
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flusher_loop, name="storage-flusher", daemon=True)
+            _flusher.start()
+    _flusher_wakeup.set()
+
+def flush_pending(path: str = None, due: float = None) -> int:
+    """Записывает отложенные файлы: все, только path или только те, чей срок наступил к due"""
+    key = os.path.abspath(path) if path is not None else None
+
+    flushed = 0
+    with _flush_lock:
+        with _pending_lock:
+            pending = [
+                (p, entry) for p, entry in _pending.items()
+                if (key is None or p == key) and (due is None or entry[0] <= due)
+            ]
+
+        for p, (_, seq, data) in pending:
+            try:
+                payload = data if isinstance(data, bytes) else _serialize(data())
+            except Exception as e:
+                _stats["errors"] += 1
+                print(f"Error saving {p}: {e}")
+                payload = None
+
+            written = payload is not None and _save(p, payload)
+            if written:
+                flushed += 1
+            with _pending_lock:
+                current = _pending.get(p)
+                # Если за время записи пришли новые данные, они останутся в очереди
+                if current is None or current[1] != seq:
+                    continue
+                if written:
+                    del _pending[p]
+                else:
+                    # Повторим через интервал, а не в плотном цикле
+                    _pending[p] = (time.monotonic() + COALESCE_INTERVAL, seq, data)
+    return flushed
+
+def _flusher_loop():
+    while True:
+        with _pending_lock:
+            due = min((entry[0] for entry in _pending.values()), default=None)
+        timeout = None if due is None else due - time.monotonic()
+        if timeout is not None and timeout <= 0:
+            flush_pending(due=time.monotonic())
+            continue
+        _flusher_wakeup.wait(timeout)
+        _flusher_wakeup.clear()
+
+def get_stats() -> Dict[str, Any]:
+    stats = dict(_stats)
+    with _pending_lock:
+        stats["pending"] = len(_pending)
+    return stats
+
+atexit.register(flush_pending)
@@ -0,0 +1,215 @@
+# telegram_sender.py
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))  # сообщений в секунду на всего бота
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))  # сообщений в секунду в личный чат
+TG_GROUP_RATE = float(os.getenv("TG_GROUP_RATE", str(20 / 60)))  # в группах лимит 20 в минуту
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "2"))  # сколько сообщений в чат можно отправить подряд
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "3"))  # повторов после RetryAfter
+TG_MAX_CHAT_BUCKETS = 10000  # после этого забываем простаивающие чаты
+
+PRIORITY_INTERACTIVE = 0  # ответы на действия пользователя
+PRIORITY_BULK = 10  # прогресс, постраничная догрузка и прочий поток правок
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def send_priority(priority: int):
+    """Задает приоритет всем запросам к Telegram внутри блока"""
+    token = _send_priority.set(priority)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+def bulk_sends():
+    """Запросы внутри блока уступают очередь интерактивным ответам"""
+    return send_priority(PRIORITY_BULK)
+
+class TokenBucket:
+    """Корзина токенов: rate в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float = None) -> float:
+        """Сколько ждать до свободного токена"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def reserve(self, now: float = None) -> float:
+        """Забирает токен в долг и возвращает, сколько ждать до его наступления"""
+        now = time.monotonic() if now is None else now
+        wait = self.delay(now)
+        self.tokens -= 1
+        return wait
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+class SendScheduler(BaseRequestMiddleware):
+    """Очередь исходящих запросов бота: общий и початовые лимиты, приоритеты и ожидание RetryAfter"""
+
+    def __init__(self, global_rate: float = TG_GLOBAL_RATE, chat_rate: float = TG_CHAT_RATE,
+                 group_rate: float = TG_GROUP_RATE, chat_burst: float = TG_CHAT_BURST, max_retries: int = TG_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._queue = []  # (приоритет, порядковый номер, чат) ждущих запросов
+        self._seq = itertools.count()
+        self._wakeup = None
+
+        self._stats = {
+            "sent": 0,
+            "delayed": 0,
+            "retry_after": 0,
+            "retry_after_seconds": 0.0,
+            "failed_after_retries": 0,
+            "wait_seconds": 0.0,
+            "max_queue_depth": 0,
+        }
+
+    # ---------- Лимиты ----------
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= TG_MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                self._chats = {key: b for key, b in self._chats.items() if not b.idle(now)}
+            # Отрицательные id — группы и каналы, у них лимит строже
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1.0 if is_group else self.chat_burst)
+        return bucket
+
+    def _pick(self, now: float):
+        """Самый приоритетный запрос, который не ждет лимит своего чата и не стоит в чате за более важным"""
+        seen = set()
+        for entry in sorted(self._queue):
+            chat_id = entry[2]
+            if chat_id in seen:
+                continue
+            seen.add(chat_id)
+            if chat_id is None or self._chat_bucket(chat_id).delay(now) <= 0:
+                return entry
+        return None
+
+    def _is_chat_head(self, entry) -> bool:
+        return all(other >= entry for other in self._queue if other[2] == entry[2])
+
+    async def acquire(self, chat_id=None, priority: int = None):
+        """Ждет, пока запрос можно отправить, не нарушая лимитов Telegram"""
+        # Приоритет действует и на общий лимит, и на лимит чата: фоновая правка не задерживает
+        # ответ пользователю в том же чате. Токены берутся только в момент выдачи,
+        # поэтому отмененный запрос ничего не занимает
+        priority = _send_priority.get() if priority is None else priority
+        started = time.monotonic()
+        if self._wakeup is None:
+            self._wakeup = asyncio.Condition()
+
+        entry = (priority, next(self._seq), chat_id)
+        async with self._wakeup:
+            heapq.heappush(self._queue, entry)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+            try:
+                while True:
+                    now = time.monotonic()
+                    timeout = None
+                    if self._pick(now) == entry:
+                        timeout = self.global_bucket.delay(now)
+                        if timeout <= 0:
+                            self.global_bucket.reserve(now)
+                            if chat_id is not None:
+                                self._chat_bucket(chat_id).reserve(now)
+                            self._queue.remove(entry)
+                            heapq.heapify(self._queue)
+                            self._wakeup.notify_all()
+                            break
+                    elif chat_id is not None and self._is_chat_head(entry):
+                        # Первый в своем чате просыпается сам, когда у чата появится токен
+                        timeout = self._chat_bucket(chat_id).delay(now) or None
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._wakeup.notify_all()
+                raise
+
+        waited = time.monotonic() - started
+        metrics.observe("telegram_wait", waited)
+        if waited > 0.001:
+            self._stats["delayed"] += 1
+            self._stats["wait_seconds"] += waited
+
+    # ---------- Middleware aiogram ----------
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # Служебные запросы (getUpdates, answerCallbackQuery) не ограничиваются
+            return await make_request(bot, method)
+
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id)
+            try:
+                with metrics.timed("telegram_send"):
+                    response = await make_request(bot, method)
+                self._stats["sent"] += 1
+                return response
+            except TelegramRetryAfter as e:
+                self._stats["retry_after"] += 1
+                self._stats["retry_after_seconds"] += e.retry_after
+                # Telegram сам сказал, сколько ждать: этот чат молчит до истечения паузы
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                if attempt == self.max_retries:
+                    self._stats["failed_after_retries"] += 1
+                    raise
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        now = time.monotonic()
+        queue = list(self._queue)
+        stats["queue_chat"] = sum(1 for _, _, chat_id in queue if chat_id is not None and self._chat_bucket(chat_id).delay(now) > 0)
+        stats["queue_global"] = len(queue) - stats["queue_chat"]
+        stats["queue_depth"] = len(queue)
+        stats["chats_tracked"] = len(self._chats)
+        return stats
+
+SEND_SCHEDULER = SendScheduler()
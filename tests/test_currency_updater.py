@@ -0,0 +1,109 @@
+# tests/test_currency_updater.py
+"""Обновление курсов против локального HTTP-сервера-заглушки: переключение источников,
+отбрасывание выброса при сверке и сохранение старых курсов, когда все источники недоступны.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import unittest
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+import rates_service
+import currency_updater
+
+GOOD = {"RUB": 90.0, "UAH": 38.0, "EUR": 0.92, "CNY": 7.2}
+
+def rates_handler(rates, delay: float = 0):
+    async def handle(request):
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response({"rates": rates})
+    return handle
+
+async def handle_error(request):
+    return web.Response(status=500)
+
+class CurrencyUpdaterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Курсы пишутся в data/ относительно текущей папки: работаем во временной
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        rates_service._snapshot = None
+
+        self.settings = {
+            name: getattr(currency_updater, name)
+            for name in ("RATE_HEDGE_DELAY", "RATE_CROSS_CHECK_WINDOW", "RATE_RETRIES", "RATE_RETRY_BACKOFF")
+        }
+        currency_updater.RATE_HEDGE_DELAY = 1.0
+        currency_updater.RATE_CROSS_CHECK_WINDOW = 1.0
+        currency_updater.RATE_RETRIES = 2
+        currency_updater.RATE_RETRY_BACKOFF = 0.05
+
+        app = web.Application()
+        app.router.add_get("/good", rates_handler(GOOD))
+        app.router.add_get("/good-slow", rates_handler(dict(GOOD, RUB=90.5), delay=0.3))
+        # В пределах RATE_MAX_JUMP от текущего курса: одиночная проверка такое пропустила бы
+        app.router.add_get("/outlier", rates_handler(dict(GOOD, RUB=120.0)))
+        app.router.add_get("/error", handle_error)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+        self.session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.runner.cleanup()
+        for name, value in self.settings.items():
+            setattr(currency_updater, name, value)
+        rates_service._snapshot = None
+        # Отложенная запись курсов должна попасть во временную папку
+        storage.flush_pending()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def urls(self, *paths):
+        return [self.base + path for path in paths]
+
+    async def test_failover_starts_next_source_without_waiting(self):
+        started = time.monotonic()
+        rates = await currency_updater.fetch_exchange_rates(self.urls("/error", "/good"), self.session)
+        elapsed = time.monotonic() - started
+
+        self.assertNotIn("stale", rates)
+        self.assertEqual(rates["RUB"], 90.0)
+        self.assertIn("/good", rates["source"])
+        self.assertNotIn("/error", rates["source"])
+        # Второй источник стартует сразу после ошибки первого, а не через RATE_HEDGE_DELAY
+        self.assertLess(elapsed, currency_updater.RATE_HEDGE_DELAY)
+
+    async def test_outlier_rejected_by_cross_check(self):
+        rates = await currency_updater.fetch_exchange_rates(self.urls("/outlier", "/good", "/good-slow"), self.session)
+
+        self.assertNotIn("stale", rates)
+        self.assertAlmostEqual(rates["RUB"], 90.25)
+        self.assertEqual(rates["EUR"], 0.92)
+
+    async def test_all_sources_down_keeps_current_rates(self):
+        before = rates_service.get_snapshot()
+        rates = await currency_updater.fetch_exchange_rates(self.urls("/error", "/error"), self.session)
+
+        self.assertTrue(rates["stale"])
+        self.assertEqual(rates["version"], before["version"])
+        self.assertEqual(rates["RUB"], before["rates"]["RUB"])
+        self.assertFalse(os.path.exists(rates_service.EXCHANGE_RATES_FILE))
+
+if __name__ == "__main__":
+    unittest.main()
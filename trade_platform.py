@@ -1,222 +1,409 @@
 # trade_platform.py
-import os
-import json
 import time
+import asyncio
+import functools
+import weakref
+import threading
 import requests
+from collections import deque
 from typing import Dict, Any, Optional
 
+import metrics
+import profiling
+from executors import NETWORK_EXECUTOR, run_disk
+import weapon_catalog
+import rates_service
+from price_cache import PriceCache
+from price_history_store import PriceHistoryStore
+from steam_client import STEAM_CLIENT, market_hash_from_url, build_price_url, parse_price_response
+
+try:
+    from translations import find_translation
+except ImportError:
+    def find_translation(weapon, text):
+        return None
+
 PRICES_FILE = "data/prices.json"
-WEAPONS_DIR = "weapons"
-EXCHANGE_RATES_FILE = "data/exchange_rates.json"
-PRICE_HISTORY_FILE = "data/price_history.json"
+WEAPONS_DIR = weapon_catalog.WEAPONS_DIR
+EXCHANGE_RATES_FILE = rates_service.EXCHANGE_RATES_FILE
+PRICE_HISTORY_FILE = "data/price_history.json"  # старый формат, переносится в PRICE_HISTORY_DB
+PRICE_HISTORY_DB = "data/price_history.db"
+PRICE_HISTORY_MAX_POINTS = 100
 CACHE_TTL = 600
+REFRESH_MIN_AGE = 60  # цены свежее этого возраста при обновлении не перезапрашиваются
+PRICE_CACHE_SIZE = 5000
+PRICE_CACHE_FLUSH_INTERVAL = 5.0
+STREAM_COMMIT_INTERVAL = 1.0  # как часто поток цен пишет накопленные ответы Steam в кэш и историю
 
 # валюты и их символы
-CURRENCY_SYMBOLS = {"USD": "$", "RUB": "₽", "UAH": "₴", "EUR": "€", "CNY": "¥"}
+CURRENCY_SYMBOLS = rates_service.CURRENCY_SYMBOLS
 
-def load_exchange_rates():
-    """Загружает курсы валют из файла"""
-    try:
-        rates_data = safe_load_json(EXCHANGE_RATES_FILE)
-        return {
-            "RUB": rates_data.get("RUB", 90.0),
-            "UAH": rates_data.get("UAH", 38.0),
-            "EUR": rates_data.get("EUR", 0.92),
-            "CNY": rates_data.get("CNY", 7.2),
-            "USD": 1.0
-        }
-    except Exception as e:
-        print(f"Error loading exchange rates: {e}")
-        return {"RUB": 90.0, "UAH": 38.0, "EUR": 0.92, "CNY": 7.2, "USD": 1.0}
+# Кэш и история хранят одну цену в USD на предмет и износ ("name||wear"),
+# в валюту пользователя цена переводится при чтении
+@functools.lru_cache(maxsize=4096)
+def canonical_item_name(item_name: str) -> str:
+    """Сводит русские и прочие алиасы скина к одному названию «Оружие | English name»"""
+    if " | " not in item_name:
+        return item_name.strip()
+    weapon_name, skin_input = (part.strip() for part in item_name.split(" | ", 1))
+    translation = find_translation(weapon_name, skin_input) if skin_input else None
+    if translation:
+        weapon_name = translation.get("weapon") or weapon_name
+        skin_input = translation["en"]
+    return f"{weapon_name} | {skin_input}"
 
-# Вспомогательные функции
-def safe_load_json(path):
-    if not os.path.exists(path):
-        return {}
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading {path}: {e}")
-        return {}
+def item_key(item_name: str, wear: str) -> str:
+    return f"{canonical_item_name(item_name)}||{wear}"
 
-def safe_save_json(path, data):
-    try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving {path}: {e}")
+def _canonical_key(key: str) -> str:
+    """Переводит ключ "name||wear", записанный по исходному названию, в канонический"""
+    item_name, sep, wear = key.rpartition("||")
+    return item_key(item_name, wear) if sep else key
 
-def update_exchange_rates(rub_rate: float = None, uah_rate: float = None, eur_rate: float = None, cny_rate: float = None):
-    """Обновляет курсы валют вручную"""
-    rates = load_exchange_rates()
+def _split_legacy_key(key: str):
+    """Разбирает старый ключ "name||wear||currency" -> ("name||wear", currency)"""
+    parts = key.rsplit("||", 2)
+    if len(parts) == 3 and parts[2] in CURRENCY_SYMBOLS:
+        return f"{parts[0]}||{parts[1]}", parts[2]
+    return None
+
+def _migrate_cache_entry(key: str, entry: Dict[str, Any]):
+    """Переводит запись prices.json старого формата (цена в валюте) в USD"""
+    data = entry.get("data", {})
+    if "price_usd" in data:
+        return _canonical_key(key), entry
     
-    if rub_rate is not None:
-        rates["RUB"] = rub_rate
-    if uah_rate is not None:
-        rates["UAH"] = uah_rate
-    if eur_rate is not None:
-        rates["EUR"] = eur_rate
-    if cny_rate is not None:
-        rates["CNY"] = cny_rate
+    legacy = _split_legacy_key(key)
+    price = data.get("price")
+    if not legacy or not price:
+        return None
     
-    rates["last_updated"] = time.time()
+    new_key, currency = legacy
+    rate = load_exchange_rates().get(currency, 1.0) or 1.0
+    return _canonical_key(new_key), {
+        "time": entry.get("time", 0),
+        "data": {"price_usd": round(price / rate, 4), "url": data.get("url", ""), "source": data.get("source", "")}
+    }
+
+def _migrate_history_key(key: str):
+    """Переводит ключ истории старого формата в USD по текущему курсу и в каноническое название"""
+    legacy = _split_legacy_key(key)
+    if not legacy:
+        new_key = _canonical_key(key)
+        return (new_key, 1.0) if new_key != key else None
+    new_key, currency = legacy
+    rate = load_exchange_rates().get(currency, 1.0) or 1.0
+    return _canonical_key(new_key), 1.0 / rate
+
+# Кэш цен живет в памяти и периодически сбрасывается в PRICES_FILE
+PRICE_CACHE = PriceCache(
+    PRICES_FILE, max_size=PRICE_CACHE_SIZE, ttl=CACHE_TTL,
+    flush_interval=PRICE_CACHE_FLUSH_INTERVAL, migrate=_migrate_cache_entry
+)
+
+# История цен хранится в SQLite: запись точки не переписывает всю историю
+HISTORY_STORE = PriceHistoryStore(
+    PRICE_HISTORY_DB, legacy_json=PRICE_HISTORY_FILE,
+    max_points=PRICE_HISTORY_MAX_POINTS, migrate_key=_migrate_history_key, keys_version=2
+)
+
+def load_exchange_rates():
+    """Возвращает курсы валют из снимка в памяти (см. rates_service)"""
+    return rates_service.get_rates()
+
+def update_exchange_rates(rub_rate: float = None, uah_rate: float = None, eur_rate: float = None, cny_rate: float = None):
+    """Обновляет курсы валют вручную"""
+    updates = {"RUB": rub_rate, "UAH": uah_rate, "EUR": eur_rate, "CNY": cny_rate}
+    snapshot = rates_service.set_rates({k: v for k, v in updates.items() if v is not None}, source="manual")
+    rates = dict(snapshot["rates"])
+    rates["last_updated"] = snapshot["updated"]
     
-    safe_save_json(EXCHANGE_RATES_FILE, rates)
     print(f"✅ Курсы обновлены: 1 USD = {rates['RUB']} RUB, {rates['UAH']} UAH, {rates['EUR']} EUR, {rates['CNY']} CNY")
     return rates
 
 # Функции поиска файлов
 def find_weapon_file(weapon_name: str) -> Optional[str]:
-    """Ищет файл оружия в папках weapons"""
-    weapon_normalized = weapon_name.lower().replace(" ", "-").replace("|", "").replace("'", "").strip()
+    """Ищет файл оружия по индексу папки weapons"""
+    return weapon_catalog.find_weapon_file(weapon_name)
+
+# Функции работы со скинами
+def parse_item_name(item_name: str):
+    """Разбирает "Оружие | Скин" и приводит русское название скина к английскому"""
+    if " | " in item_name:
+        weapon_name, skin_input = item_name.split(" | ", 1)
+        weapon_name = weapon_name.strip()
+        skin_input = skin_input.strip()
+    else:
+        weapon_name = item_name
+        skin_input = ""
     
-    categories = ["rifles", "pistols", "smgs", "knives", "gloves", "heavy", "shotguns", "snipers"]
+    # Русские названия из инвентаря приводим к каноническому английскому
+    translation = find_translation(weapon_name, skin_input) if skin_input else None
+    if translation:
+        skin_input = translation["en"]
     
-    for category in categories:
-        category_path = os.path.join(WEAPONS_DIR, category)
-        if not os.path.exists(category_path):
-            continue
-            
-        for filename in os.listdir(category_path):
-            if filename.endswith('.json'):
-                file_weapon = filename.replace('.json', '').lower()
-                if (weapon_normalized in file_weapon or 
-                    file_weapon in weapon_normalized or
-                    weapon_name.lower() in file_weapon):
-                    return os.path.join(category_path, filename)
+    return weapon_name, skin_input
+
+def _skin_data(skin: Optional[Dict[str, Any]], wear: str) -> Optional[Dict[str, Any]]:
+    """Выбирает ссылку и локальную цену скина для нужного износа"""
+    if not skin:
+        return None
+    
+    skin_name = skin.get("name", "")
+    links = skin.get("links", {})
+    prices = skin.get("prices", {})
+    
+    # Возвращаем URL и цену
+    if wear in links:
+        return {
+            "market_url": links[wear],
+            "skin_name": skin_name,
+            "wear": wear,
+            "price_usd": prices.get(wear, 0)  # Берем цену из локального файла
+        }
+    
+    # Берем первый доступный износ
+    for available_wear, url in links.items():
+        return {
+            "market_url": url,
+            "skin_name": skin_name,
+            "wear": available_wear,
+            "price_usd": prices.get(available_wear, 0)
+        }
     
     return None
 
-# Функции работы со скинами
 def get_skin_data_from_file(weapon_name: str, skin_input: str, wear: str) -> Optional[Dict[str, Any]]:
     """Ищет данные скина в JSON файлах weapons"""
     weapon_file = find_weapon_file(weapon_name)
     if not weapon_file:
         return None
     
-    weapon_data = safe_load_json(weapon_file)
-    if not weapon_data:
-        return None
-    
-    for skin in weapon_data:
-        skin_name = skin.get("name", "")
-        
-        if (skin_input.lower() == skin_name.lower() or
-            skin_input.lower() in skin_name.lower()):
-            
-            links = skin.get("links", {})
-            prices = skin.get("prices", {})
-            
-            # Возвращаем URL и цену
-            if wear in links:
-                return {
-                    "market_url": links[wear],
-                    "skin_name": skin_name,
-                    "wear": wear,
-                    "price_usd": prices.get(wear, 0)  # Берем цену из локального файла
-                }
-            else:
-                # Берем первый доступный износ
-                for available_wear, url in links.items():
-                    return {
-                        "market_url": url,
-                        "skin_name": skin_name,
-                        "wear": available_wear,
-                        "price_usd": prices.get(available_wear, 0)
-                    }
-    
-    return None
+    return _skin_data(weapon_catalog.find_skin(weapon_file, skin_input), wear)
 
 # Функции работы с Steam API (оставляем как fallback)
 def fetch_steam_price(market_url: str, currency: str) -> Optional[float]:
     """Получает цену с Steam Market по URL"""
     try:
-        if "/market/listings/730/" in market_url:
-            market_hash = market_url.split("/market/listings/730/")[1]
-            
-            currency_codes = {"USD": 1, "RUB": 5, "UAH": 18, "EUR": 3, "CNY": 23}
-            code = currency_codes.get(currency, 1)
-            
-            api_url = f"https://steamcommunity.com/market/priceoverview/?currency={code}&appid=730&market_hash_name={market_hash}"
-            
-            resp = requests.get(api_url, timeout=10)
-            data = resp.json()
-            
-            if data.get("success") and "lowest_price" in data:
-                price_str = data["lowest_price"]
-                clean = price_str.replace("$", "").replace("₽", "").replace("₴", "").replace("€", "").replace("¥", "").replace("р.", "").replace(",", ".").strip()
-                return float(clean)
+        market_hash = market_hash_from_url(market_url)
+        if market_hash:
+            with metrics.timed("steam_fetch"):
+                resp = requests.get(build_price_url(market_hash, currency), timeout=10)
+            return parse_price_response(resp.json())
                 
     except Exception as e:
+        metrics.inc("steam_fetch_errors")
         print(f"Error fetching Steam price: {e}")
     
     return None
 
+# Одновременные запросы одного и того же предмета (ссылка задает скин и износ)
+# объединяются: в Steam уходит один запрос, остальные ждут его результат
+_inflight_fetches: Dict[tuple, "asyncio.Task"] = {}
+_claimed_fetches = weakref.WeakSet()  # запросы, результат которых уже взялся записать один из ожидающих
+_singleflight_stats = {"fetches": 0, "coalesced": 0}
+
+async def _fetch_shared(market_url: str, currency: str):
+    """Цена из Steam и признак, что результат записывает именно этот вызов (один на объединенный запрос)"""
+    key = (market_url, currency)
+    task = _inflight_fetches.get(key)
+    
+    if task is None:
+        task = asyncio.ensure_future(STEAM_CLIENT.fetch_price(market_url, currency))
+        _inflight_fetches[key] = task
+        task.add_done_callback(lambda _: _inflight_fetches.pop(key, None))
+        _singleflight_stats["fetches"] += 1
+    else:
+        _singleflight_stats["coalesced"] += 1
+    
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    price = await asyncio.shield(task)
+    # Записывает первый дождавшийся, поэтому отмена отправителя не теряет результат
+    owner = task not in _claimed_fetches
+    _claimed_fetches.add(task)
+    return price, owner
+
+async def fetch_steam_price_async(market_url: str, currency: str) -> Optional[float]:
+    """Асинхронно получает цену с Steam Market через общий пул соединений"""
+    price, _ = await _fetch_shared(market_url, currency)
+    return price
+
+def get_singleflight_stats() -> Dict[str, int]:
+    """Сколько запросов ушло в Steam и сколько было сэкономлено объединением"""
+    stats = dict(_singleflight_stats)
+    stats["in_flight"] = len(_inflight_fetches)
+    return stats
+
 # Функции управления кэшем
 def clear_price_cache(skin_name: str = None, wear: str = None, currency: str = None):
     """Очищает кэш цен для конкретного скина или всех скинов"""
-    prices_cache = safe_load_json(PRICES_FILE)
-    
     if skin_name is None:
         # Очищаем весь кэш
-        prices_cache = {}
+        PRICE_CACHE.clear()
     else:
-        # Очищаем конкретный скин
-        key = f"{skin_name}||{wear}||{currency}"
-        if key in prices_cache:
-            del prices_cache[key]
+        # Очищаем конкретный скин (кэш общий для всех валют)
+        PRICE_CACHE.delete(item_key(skin_name, wear))
     
-    safe_save_json(PRICES_FILE, prices_cache)
     return True
 
+def get_price_cache_stats() -> Dict[str, Any]:
+    """Статистика кэша цен"""
+    return PRICE_CACHE.stats()
+
+def preload_prices() -> int:
+    """Читает кэш цен и курсы с диска до старта, чтобы чтения кэша из цикла событий не ждали файлов"""
+    load_exchange_rates()
+    return PRICE_CACHE.load()
+
+def flush_price_cache():
+    """Сбрасывает кэш цен на диск"""
+    return PRICE_CACHE.flush()
+
 def clear_all_prices_cache():
     """Очищает весь кэш цен"""
     return clear_price_cache()
 
 # Функции работы с историей цен
+# Агрегаты по каждому ключу истории поддерживаются при записи,
+# поэтому рост и тренд читаются из памяти без обращения к диску
+HISTORY_WINDOW = 10
+INSUFFICIENT_TREND = {"trend": "📊 Недостаточно данных", "confidence": "Низкая"}
+
+_history_lock = threading.RLock()
+_history_aggregates: Dict[str, Dict[str, Any]] = {}
+_history_aggregates_loaded = False
+
+def _new_history_aggregate() -> Dict[str, Any]:
+    return {"count": 0, "recent": deque(maxlen=HISTORY_WINDOW), "trend": INSUFFICIENT_TREND}
+
+def _classify_trend(prices) -> Dict[str, Any]:
+    """Классифицирует тренд по последним ценам"""
+    if len(prices) < 2:
+        return INSUFFICIENT_TREND
+    
+    # Простой анализ тренда
+    first_price = prices[0]
+    last_price = prices[-1]
+    change = last_price - first_price
+    percent_change = (change / first_price) * 100 if first_price > 0 else 0
+    
+    # Определяем тренд
+    if percent_change > 5:
+        trend = "📈 Сильный рост"
+        confidence = "Высокая"
+    elif percent_change > 2:
+        trend = "📈 Умеренный рост" 
+        confidence = "Средняя"
+    elif percent_change > -2:
+        trend = "➡️ Стабильный"
+        confidence = "Средняя"
+    elif percent_change > -5:
+        trend = "📉 Умеренное падение"
+        confidence = "Средняя"
+    else:
+        trend = "📉 Сильное падение"
+        confidence = "Высокая"
+    
+    return {
+        "trend": trend,
+        "confidence": confidence,
+        "change_percent": round(percent_change, 1)
+    }
+
+def _refresh_trend(aggregate: Dict[str, Any]):
+    if aggregate["count"] < 5:
+        aggregate["trend"] = INSUFFICIENT_TREND
+    else:
+        aggregate["trend"] = _classify_trend([price for _, price in aggregate["recent"]])
+
+def _add_history_point(aggregate: Dict[str, Any], timestamp: float, price: float):
+    """Учитывает новую точку в агрегате ключа"""
+    aggregate["recent"].append((timestamp, price))
+    aggregate["count"] = min(aggregate["count"] + 1, PRICE_HISTORY_MAX_POINTS)
+    _refresh_trend(aggregate)
+
+def load_history_aggregates() -> int:
+    """Строит агрегаты по всей истории одним запросом"""
+    global _history_aggregates_loaded
+    
+    with _history_lock:
+        aggregates = {}
+        for key, entry in HISTORY_STORE.recent_by_key(HISTORY_WINDOW).items():
+            aggregate = _new_history_aggregate()
+            aggregate["recent"].extend((point["timestamp"], point["price"]) for point in entry["points"])
+            aggregate["count"] = min(entry["count"], PRICE_HISTORY_MAX_POINTS)
+            _refresh_trend(aggregate)
+            aggregates[key] = aggregate
+        
+        _history_aggregates.clear()
+        _history_aggregates.update(aggregates)
+        _history_aggregates_loaded = True
+        return len(aggregates)
+
+def _get_history_aggregate(key: str) -> Optional[Dict[str, Any]]:
+    if not _history_aggregates_loaded:
+        load_history_aggregates()
+    return _history_aggregates.get(key)
+
 def save_price_history(item_name: str, wear: str, currency: str, price: float, url: str = ""):
     """Сохраняет историю цен для анализа трендов"""
+    rate = load_exchange_rates().get(currency, 1.0) or 1.0
+    save_price_history_many([(item_name, wear, price / rate, url)])
+
+def save_price_history_many(points):
+    """Сохраняет пачку точек (item_name, wear, price_usd, url) одной транзакцией"""
     try:
-        history = safe_load_json(PRICE_HISTORY_FILE)
-        
-        key = f"{item_name}||{wear}||{currency}"
         timestamp = int(time.time())
+        rows = [
+            (item_key(item_name, wear), timestamp, price_usd, url)
+            for item_name, wear, price_usd, url in points
+        ]
         
-        if key not in history:
-            history[key] = []
-        
-        history[key].append({
-            "timestamp": timestamp,
-            "price": price,
-            "url": url
-        })
-        
-        # Храним только последние 100 записей
-        if len(history[key]) > 100:
-            history[key] = history[key][-100:]
-        
-        safe_save_json(PRICE_HISTORY_FILE, history)
+        with metrics.timed("history_write"), _history_lock:
+            HISTORY_STORE.append_many(rows)
+            
+            # Если агрегаты еще не загружены, они прочитают эти точки из базы
+            if _history_aggregates_loaded:
+                for key, ts, price, _ in rows:
+                    aggregate = _history_aggregates.get(key)
+                    if aggregate is None:
+                        aggregate = _history_aggregates[key] = _new_history_aggregate()
+                    _add_history_point(aggregate, ts, price)
         
     except Exception as e:
         print(f"Error saving price history: {e}")
 
-def calculate_growth_from_local_history(item_name: str, wear: str, currency: str, current_price: float) -> Dict[str, str]:
+def get_price_history(item_name: str, wear: str, currency: str = "USD", since: float = None, until: float = None):
+    """Возвращает историю цен скина за период в нужной валюте"""
+    rate = load_exchange_rates().get(currency, 1.0)
+    points = HISTORY_STORE.range(item_key(item_name, wear), since, until)
+    for point in points:
+        point["price"] = round(point["price"] * rate, 2)
+    return points
+
+def _format_change(current_price: float, reference_price: float, symbol: str) -> str:
+    change = current_price - reference_price
+    percent = (change / reference_price) * 100 if reference_price > 0 else 0
+    return f"{'+' if change > 0 else ''}{round(change, 2)}{symbol} ({'+' if percent > 0 else ''}{round(percent, 1)}%)"
+
+def calculate_growth_from_local_history(item_name: str, wear: str, currency: str, current_price: float, rates: Dict[str, float] = None) -> Dict[str, str]:
     """Рассчитывает рост цен из локальной истории"""
     symbol = CURRENCY_SYMBOLS.get(currency, "$")
     
     try:
-        history = safe_load_json(PRICE_HISTORY_FILE)
-        key = f"{item_name}||{wear}||{currency}"
+        rate = (rates or load_exchange_rates()).get(currency, 1.0)
+        key = item_key(item_name, wear)
+        with _history_lock:
+            aggregate = _get_history_aggregate(key)
+            price_history = list(aggregate["recent"]) if aggregate and aggregate["count"] >= 2 else None
         
-        if key not in history or len(history[key]) < 2:
+        if not price_history:
             return {
                 "24h": "N/A",
                 "7d": "N/A", 
                 "30d": "N/A"
             }
         
-        price_history = history[key]
         now = time.time()
         
         # Находим цены за разные периоды
@@ -224,15 +411,16 @@ def calculate_growth_from_local_history(item_name: str, wear: str, currency: str
         price_7d = None
         price_30d = None
         
-        for entry in reversed(price_history):
-            age_hours = (now - entry["timestamp"]) / 3600
+        for timestamp, price_usd in reversed(price_history):
+            price = round(price_usd * rate, 2)
+            age_hours = (now - timestamp) / 3600
             
             if age_hours <= 24 and price_24h is None:
-                price_24h = entry["price"]
+                price_24h = price
             if age_hours <= 168 and price_7d is None:  # 7 дней
-                price_7d = entry["price"]
+                price_7d = price
             if age_hours <= 720 and price_30d is None:  # 30 дней
-                price_30d = entry["price"]
+                price_30d = price
             
             if all([price_24h, price_7d, price_30d]):
                 break
@@ -241,19 +429,13 @@ def calculate_growth_from_local_history(item_name: str, wear: str, currency: str
         
         # Рассчитываем изменения
         if price_24h:
-            change = current_price - price_24h
-            percent = (change / price_24h) * 100 if price_24h > 0 else 0
-            growth_data["24h"] = f"{'+' if change > 0 else ''}{round(change, 2)}{symbol} ({'+' if percent > 0 else ''}{round(percent, 1)}%)"
+            growth_data["24h"] = _format_change(current_price, price_24h, symbol)
         
         if price_7d:
-            change = current_price - price_7d
-            percent = (change / price_7d) * 100 if price_7d > 0 else 0
-            growth_data["7d"] = f"{'+' if change > 0 else ''}{round(change, 2)}{symbol} ({'+' if percent > 0 else ''}{round(percent, 1)}%)"
+            growth_data["7d"] = _format_change(current_price, price_7d, symbol)
         
         if price_30d:
-            change = current_price - price_30d
-            percent = (change / price_30d) * 100 if price_30d > 0 else 0
-            growth_data["30d"] = f"{'+' if change > 0 else ''}{round(change, 2)}{symbol} ({'+' if percent > 0 else ''}{round(percent, 1)}%)"
+            growth_data["30d"] = _format_change(current_price, price_30d, symbol)
         
         # Заполняем недостающие данные
         for period in ["24h", "7d", "30d"]:
@@ -266,131 +448,268 @@ def calculate_growth_from_local_history(item_name: str, wear: str, currency: str
         print(f"Error calculating growth from local history: {e}")
         return {"24h": "N/A", "7d": "N/A", "30d": "N/A"}
 
-def analyze_price_trend(item_name: str, wear: str, currency: str) -> Dict[str, Any]:
-    """Анализирует тренд цены на основе истории"""
+def analyze_price_trend(item_name: str, wear: str, currency: str = "USD") -> Dict[str, Any]:
+    """Анализирует тренд цены на основе истории (процент изменения не зависит от валюты)"""
     try:
-        history = safe_load_json(PRICE_HISTORY_FILE)
-        key = f"{item_name}||{wear}||{currency}"
-        
-        if key not in history or len(history[key]) < 5:
-            return {"trend": "📊 Недостаточно данных", "confidence": "Низкая"}
-        
-        prices = [entry["price"] for entry in history[key][-10:]]  # Берем последние 10 записей
-        
-        if len(prices) < 2:
-            return {"trend": "📊 Недостаточно данных", "confidence": "Низкая"}
-        
-        # Простой анализ тренда
-        first_price = prices[0]
-        last_price = prices[-1]
-        change = last_price - first_price
-        percent_change = (change / first_price) * 100 if first_price > 0 else 0
-        
-        # Определяем тренд
-        if percent_change > 5:
-            trend = "📈 Сильный рост"
-            confidence = "Высокая"
-        elif percent_change > 2:
-            trend = "📈 Умеренный рост" 
-            confidence = "Средняя"
-        elif percent_change > -2:
-            trend = "➡️ Стабильный"
-            confidence = "Средняя"
-        elif percent_change > -5:
-            trend = "📉 Умеренное падение"
-            confidence = "Средняя"
-        else:
-            trend = "📉 Сильное падение"
-            confidence = "Высокая"
-        
-        return {
-            "trend": trend,
-            "confidence": confidence,
-            "change_percent": round(percent_change, 1)
-        }
+        key = item_key(item_name, wear)
+        with _history_lock:
+            aggregate = _get_history_aggregate(key)
+            trend = aggregate["trend"] if aggregate else INSUFFICIENT_TREND
+        return dict(trend)
         
     except Exception as e:
         print(f"Error analyzing price trend: {e}")
         return {"trend": "📊 Ошибка анализа", "confidence": "Низкая"}
 
 # Главная функция
-def get_item_price(item_name: str, wear: str = None, currency: str = "RUB", force_refresh: bool = False) -> Dict[str, Any]:
-    """Основная функция получения цены скина"""
-    prices_cache = safe_load_json(PRICES_FILE)
-    now = time.time()
-    key = f"{item_name}||{wear}||{currency}"
-    
-    # Если не принудительное обновление, проверяем кэш
-    if not force_refresh and key in prices_cache and (now - prices_cache[key].get("time", 0) < CACHE_TTL):
-        cached_data = prices_cache[key]["data"]
-        return cached_data
-    
-    # Парсим название оружия и скина
-    if " | " in item_name:
-        weapon_name, skin_input = item_name.split(" | ", 1)
-        weapon_name = weapon_name.strip()
-        skin_input = skin_input.strip()
-    else:
-        weapon_name = item_name
-        skin_input = ""
-    
-    # Ищем скин в наших данных
-    skin_data = get_skin_data_from_file(weapon_name, skin_input, wear)
-    
-    result_data = {
+def _empty_result() -> Dict[str, Any]:
+    return {
         "price": None,
         "url": "",
         "growth": {},
         "trend": {"trend": "N/A", "confidence": "N/A"},
         "source": "not_found"
     }
+
+def _priced_result(item_name: str, wear: str, currency: str, price_usd: float, market_url: str, source: str, rates: Dict[str, float]) -> Dict[str, Any]:
+    """Конвертирует цену в нужную валюту и добавляет рост и тренд"""
+    with metrics.timed("price_convert"):
+        rate = rates.get(currency, 1.0)
+        final_price = round(price_usd * rate, 2)
     
-    if skin_data:
-        market_url = skin_data["market_url"]
-        actual_wear = skin_data["wear"]
-        price_usd = skin_data["price_usd"]
-        
-        # Если есть локальная цена, используем её
-        if price_usd and price_usd > 0:
-            # Конвертируем в нужную валюту
-            exchange_rates = load_exchange_rates()
-            rate = exchange_rates.get(currency, 1.0)
-            final_price = round(price_usd * rate, 2)
-            
-            result_data = {
-                "price": final_price,
-                "url": market_url,
-                "growth": calculate_growth_from_local_history(item_name, wear, currency, final_price),
-                "trend": analyze_price_trend(item_name, wear, currency),
-                "source": "local_db"
-            }
+    return {
+        "price": final_price,
+        "url": market_url,
+        "growth": calculate_growth_from_local_history(item_name, wear, currency, final_price, rates),
+        "trend": analyze_price_trend(item_name, wear, currency),
+        "source": source
+    }
+
+def _plan_prices(items, currency: str, force_refresh: bool):
+    """Отвечает из кэша и локальных цен; возвращает то, что нужно запросить в Steam"""
+    now = time.time()
+    rates = load_exchange_rates()
+    results: Dict[str, Dict[str, Any]] = {}
+    priced = {}
+    to_fetch = []
+    
+    # 1. Попадания в кэш (одна запись на предмет для всех валют)
+    misses = {}
+    for item_name, wear in items:
+        key = item_key(item_name, wear)
+        if key in results or key in misses:
+            continue
+        cached_data = None
+        if not force_refresh:
+            with metrics.timed("cache_lookup"):
+                cached_data = PRICE_CACHE.get(key, now)
+        if cached_data is not None:
+            results[key] = _priced_result(
+                item_name, wear, currency, cached_data["price_usd"], cached_data["url"], cached_data["source"], rates
+            )
+        else:
+            misses[key] = (item_name, wear)
+    
+    # 2. Группируем промахи по файлу оружия, чтобы каждый файл читался один раз
+    groups: Dict[str, list] = {}
+    for key, (item_name, wear) in misses.items():
+        try:
+            weapon_name, skin_input = parse_item_name(item_name)
+            weapon_file = find_weapon_file(weapon_name)
+        except Exception as e:
+            print(f"Error resolving {item_name}: {e}")
+            weapon_file = None
         
-        # Если нет локальной цены, пробуем Steam API
+        if not weapon_file:
+            results[key] = _empty_result()
+            continue
+        groups.setdefault(weapon_file, []).append((key, item_name, wear, skin_input))
+    
+    # 3. Локальные цены сразу, остальные — в Steam
+    for weapon_file, group in groups.items():
+        weapon_data = weapon_catalog.load_weapon_file(weapon_file)
+        for key, item_name, wear, skin_input in group:
+            skin_data = _skin_data(weapon_catalog.find_skin_in(weapon_data, skin_input), wear)
+            if not skin_data:
+                results[key] = _empty_result()
+            elif skin_data["price_usd"] and skin_data["price_usd"] > 0:
+                priced[key] = (item_name, wear, skin_data["price_usd"], skin_data["market_url"], "local_db")
+            else:
+                to_fetch.append((key, item_name, wear, skin_data["market_url"]))
+    
+    return now, rates, results, priced, to_fetch
+
+def _commit_prices(items, currency: str, now: float, rates, results, priced, to_fetch, usd_prices, shared=()):
+    """Конвертирует цены, пишет кэш и историю пачкой и собирает ответ в порядке items
+
+    shared — ключи, чью цену из объединенного запроса уже записывает другой вызов
+    """
+    for (key, item_name, wear, market_url), usd_price in zip(to_fetch, usd_prices):
+        if usd_price:
+            priced[key] = (item_name, wear, usd_price, market_url, "steam")
         else:
-            usd_price = fetch_steam_price(market_url, "USD")
-            
+            results[key] = _empty_result()
+    
+    # Рост и тренд считаются до записи новой точки, затем кэш и история пишутся пачкой
+    for key, (item_name, wear, price_usd, market_url, source) in priced.items():
+        results[key] = _priced_result(item_name, wear, currency, price_usd, market_url, source, rates)
+    _store_prices({key: value for key, value in priced.items() if key not in shared}, now)
+    
+    return [results[item_key(item_name, wear)] for item_name, wear in items]
+
+def _store_prices(priced, now: float):
+    """Пишет цены {key: (item_name, wear, price_usd, url, source)} в кэш и историю одной пачкой"""
+    if not priced:
+        return
+    PRICE_CACHE.set_many({
+        key: {"price_usd": price_usd, "url": market_url, "source": source}
+        for key, (_, _, price_usd, market_url, source) in priced.items()
+    }, now)
+    save_price_history_many([
+        (item_name, wear, price_usd, market_url)
+        for item_name, wear, price_usd, market_url, _ in priced.values()
+    ])
+
+@profiling.profiled("pricing")
+def get_item_prices(items, currency: str = "RUB", force_refresh: bool = False):
+    """Пакетно получает цены для списка (item_name, wear) в порядке входного списка"""
+    items = [(item_name, wear) for item_name, wear in items]
+    now, rates, results, priced, to_fetch = _plan_prices(items, currency, force_refresh)
+    
+    if len(to_fetch) == 1:
+        usd_prices = [fetch_steam_price(to_fetch[0][3], "USD")]
+    else:
+        # Сетевые запросы идут в общий сетевой пул; при заполненной очереди отправка ждет
+        futures = [NETWORK_EXECUTOR.submit(fetch_steam_price, market_url, "USD") for _, _, _, market_url in to_fetch]
+        usd_prices = [future.result() for future in futures]
+    
+    return _commit_prices(items, currency, now, rates, results, priced, to_fetch, usd_prices)
+
+@profiling.profiled("pricing")
+async def get_item_prices_async(items, currency: str = "RUB", force_refresh: bool = False):
+    """Асинхронная версия get_item_prices: промахи запрашиваются в Steam без потоков"""
+    items = [(item_name, wear) for item_name, wear in items]
+    # Чтение файлов оружия и запись истории — в дисковом пуле, чтобы не держать цикл событий
+    now, rates, results, priced, to_fetch = await run_disk(_plan_prices, items, currency, force_refresh)
+    
+    fetched = await asyncio.gather(*(_fetch_shared(market_url, "USD") for _, _, _, market_url in to_fetch))
+    usd_prices = [price for price, _ in fetched]
+    # Объединенный запрос записывает в кэш и историю только его отправитель
+    shared = {entry[0] for entry, (_, owner) in zip(to_fetch, fetched) if not owner}
+    
+    return await run_disk(_commit_prices, items, currency, now, rates, results, priced, to_fetch, usd_prices, shared)
+
+@profiling.profiled("pricing")
+async def iter_item_prices_async(items, currency: str = "RUB", force_refresh: bool = False,
+                                 commit_interval: float = STREAM_COMMIT_INTERVAL):
+    """Отдает цены пачками [(индекс, результат)] по мере готовности: сначала кэш и локальная база
+    (эта пачка отдается всегда, даже пустая), затем ответы Steam по одному
+    """
+    items = [(item_name, wear) for item_name, wear in items]
+    now, rates, results, priced, to_fetch = await run_disk(_plan_prices, items, currency, force_refresh)
+    
+    indices: Dict[str, list] = {}
+    for index, (item_name, wear) in enumerate(items):
+        indices.setdefault(item_key(item_name, wear), []).append(index)
+    
+    # Все, что известно без сети, отдается одной пачкой — сразу, не дожидаясь Steam
+    await run_disk(_commit_prices, [], currency, now, rates, results, priced, [], [])
+    yield [(index, results[key]) for key in results for index in indices[key]]
+    
+    async def fetch(entry):
+        return (entry,) + await _fetch_shared(entry[3], "USD")
+    
+    # Ответы Steam отдаются по одному, а в кэш и историю пишутся пачкой
+    # не чаще раза в commit_interval и в конце потока
+    unsaved = {}
+    last_commit = time.monotonic()
+    tasks = [asyncio.ensure_future(fetch(entry)) for entry in to_fetch]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            (key, item_name, wear, market_url), usd_price, owner = await next_done
             if usd_price:
-                # Конвертируем в нужную валюту
-                exchange_rates = load_exchange_rates()
-                rate = exchange_rates.get(currency, 1.0)
-                final_price = round(usd_price * rate, 2)
-                
-                result_data = {
-                    "price": final_price,
-                    "url": market_url,
-                    "growth": calculate_growth_from_local_history(item_name, wear, currency, final_price),
-                    "trend": analyze_price_trend(item_name, wear, currency),
-                    "source": "steam"
-                }
-        
-        # Сохраняем в кэш и историю
-        if result_data["price"]:
-            prices_cache[key] = {
-                "time": now,
-                "data": result_data
-            }
-            safe_save_json(PRICES_FILE, prices_cache)
+                results[key] = _priced_result(item_name, wear, currency, usd_price, market_url, "steam", rates)
+                if owner:
+                    unsaved[key] = (item_name, wear, usd_price, market_url, "steam")
+            else:
+                results[key] = _empty_result()
+            yield [(index, results[key]) for index in indices[key]]
             
-            save_price_history(item_name, wear, currency, result_data["price"], market_url)
+            if unsaved and time.monotonic() - last_commit >= commit_interval:
+                batch, unsaved = unsaved, {}
+                await run_disk(_store_prices, batch, now)
+                last_commit = time.monotonic()
+    finally:
+        # Если потребитель перестал читать, незавершенные запросы не нужны
+        for task in tasks:
+            task.cancel()
+        if unsaved:
+            await run_disk(_store_prices, unsaved, now)
+
+def estimate_inventory_value(items, currency: str = "RUB"):
+    """Оценивает стоимость (item_name, wear, amount) по кэшу без запросов: (сумма, сколько предметов с ценой)"""
+    rate = load_exchange_rates().get(currency, 1.0)
+    total = 0.0
+    known = 0
+    for item_name, wear, amount in items:
+        entry = PRICE_CACHE.get_entry(item_key(item_name, wear))
+        if entry and entry["data"].get("price_usd"):
+            total += round(entry["data"]["price_usd"] * rate, 2) * amount
+            known += 1
+    return round(total, 2), known
+
+def plan_refresh(items, min_age: float = REFRESH_MIN_AGE, now: float = None):
+    """Отбирает устаревшие предметы (item_name, wear, amount): самые дорогие и старые — первыми"""
+    now = time.time() if now is None else now
+    stale = []
+    fresh = []
+    
+    for item_name, wear, amount in items:
+        entry = PRICE_CACHE.get_entry(item_key(item_name, wear))
+        age = now - entry["time"] if entry else float("inf")
+        if age < min_age:
+            fresh.append((item_name, wear))
+            continue
+        value = entry["data"].get("price_usd", 0) * amount if entry else 0
+        stale.append((value, age, item_name, wear))
     
-    return result_data
\ No newline at end of file
+    stale.sort(key=lambda entry: (-entry[0], -entry[1]))
+    return [(item_name, wear) for _, _, item_name, wear in stale], fresh
+
+def stream_refresh_prices(items, currency: str = "RUB", min_age: float = REFRESH_MIN_AGE):
+    """Планирует обновление (item_name, wear, amount); возвращает (поток пачек [(индекс, результат)], статистику)"""
+    items = [(item_name, wear, amount) for item_name, wear, amount in items]
+    stale, fresh = plan_refresh(items, min_age)
+    
+    indices: Dict[str, list] = {}
+    for index, (item_name, wear, _) in enumerate(items):
+        indices.setdefault(item_key(item_name, wear), []).append(index)
+    
+    def unique(batch):
+        return list({item_key(item_name, wear): (item_name, wear) for item_name, wear in batch}.values())
+    
+    stale, fresh = unique(stale), unique(fresh)
+    
+    @profiling.profiled("pricing")
+    async def refresh_stream():
+        # Свежие отдаются сразу из кэша, устаревшие запрашиваются в порядке приоритета
+        for batch, force_refresh in ((fresh, False), (stale, True)):
+            async for ready in iter_item_prices_async(batch, currency, force_refresh):
+                if ready:
+                    yield [
+                        (index, result)
+                        for position, result in ready
+                        for index in indices[item_key(*batch[position])]
+                    ]
+    
+    return refresh_stream(), {"refreshed": len(stale), "fresh": len(fresh)}
+
+@profiling.profiled("pricing")
+def get_item_price(item_name: str, wear: str = None, currency: str = "RUB", force_refresh: bool = False) -> Dict[str, Any]:
+    """Основная функция получения цены скина"""
+    return get_item_prices([(item_name, wear)], currency, force_refresh)[0]
+
+@profiling.profiled("pricing")
+async def get_item_price_async(item_name: str, wear: str = None, currency: str = "RUB", force_refresh: bool = False) -> Dict[str, Any]:
+    """Асинхронная версия get_item_price"""
+    return (await get_item_prices_async([(item_name, wear)], currency, force_refresh))[0]
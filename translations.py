@@ -373,4 +373,29 @@ TRANSLATIONS = {
 
 
 
-}
\ No newline at end of file
+}
+
+
+# ---------- Индекс алиасов ----------
+def normalize_alias(text: str) -> str:
+    """Нормализует название для поиска: регистр, ё/е, дефисы и пробелы"""
+    text = text.lower().replace("ё", "е").replace("-", " ").replace("_", " ")
+    return " ".join(text.split())
+
+def build_alias_index(translations: dict) -> dict:
+    """Строит индекс (оружие, алиас) -> перевод"""
+    index = {}
+    for translation_data in translations.values():
+        weapon = normalize_alias(translation_data.get("weapon", ""))
+        aliases = list(translation_data.get("ru", [])) + [translation_data.get("en", "")]
+        for alias in aliases:
+            if alias:
+                # Как и при переборе словаря, побеждает первое совпадение
+                index.setdefault((weapon, normalize_alias(alias)), translation_data)
+    return index
+
+ALIAS_INDEX = build_alias_index(TRANSLATIONS)
+
+def find_translation(weapon: str, text: str):
+    """Возвращает перевод скина по оружию и русскому (или английскому) названию"""
+    return ALIAS_INDEX.get((normalize_alias(weapon), normalize_alias(text)))
@@ -0,0 +1,176 @@
+# user_store.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+from storage import safe_load_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory (
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    wear TEXT,
+    amount INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (user_id, name)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class UserStore:
+    """Инвентари и настройки пользователей в SQLite с кэшем чтения по пользователю"""
+
+    def __init__(self, path: str, inventory_json: str = None, settings_json: str = None):
+        self.path = path
+        self.inventory_json = inventory_json
+        self.settings_json = settings_json
+
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._inventories: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._settings: Dict[str, Dict[str, Any]] = {}
+
+    # ---------- Подключение ----------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+        self.import_json()
+        return conn
+
+    def import_json(self, force: bool = False) -> Dict[str, int]:
+        """Однократно переносит data/inventory.json и data/user_settings.json в базу"""
+        conn = self._conn or self._connect()
+        if not force and conn.execute("SELECT 1 FROM meta WHERE name = 'json_imported'").fetchone():
+            return {"inventory": 0, "settings": 0}
+
+        inventory_rows = []
+        for user_id, user_inv in (safe_load_json(self.inventory_json) if self.inventory_json else {}).items():
+            if not isinstance(user_inv, dict):
+                continue
+            for name, data in user_inv.items():
+                # Пропускаем записи старого формата без user_id
+                if isinstance(data, dict):
+                    inventory_rows.append((str(user_id), name, data.get("wear"), int(data.get("amount", 1))))
+
+        settings_rows = [
+            (str(user_id), json.dumps(data, ensure_ascii=False))
+            for user_id, data in (safe_load_json(self.settings_json) if self.settings_json else {}).items()
+            if isinstance(data, dict)
+        ]
+
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO inventory (user_id, name, wear, amount) VALUES (?, ?, ?, ?)", inventory_rows
+            )
+            conn.executemany("INSERT OR REPLACE INTO settings (user_id, data) VALUES (?, ?)", settings_rows)
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('json_imported', ?)", (str(time.time()),))
+
+        with self._lock:
+            self._inventories.clear()
+            self._settings.clear()
+
+        if inventory_rows or settings_rows:
+            print(f"✅ Данные пользователей перенесены в {self.path}: {len(inventory_rows)} скинов, {len(settings_rows)} настроек")
+        return {"inventory": len(inventory_rows), "settings": len(settings_rows)}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------- Инвентарь ----------
+    def _load_inventory(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        inv = self._inventories.get(user_id)
+        if inv is None:
+            rows = self._connect().execute(
+                "SELECT name, wear, amount FROM inventory WHERE user_id = ? ORDER BY rowid", (user_id,)
+            ).fetchall()
+            inv = {name: {"wear": wear, "amount": amount} for name, wear, amount in rows}
+            self._inventories[user_id] = inv
+        return inv
+
+    def get_inventory(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Инвентарь одного пользователя: {name: {"wear", "amount"}}"""
+        with self._lock:
+            return {name: dict(data) for name, data in self._load_inventory(str(user_id)).items()}
+
+    def set_item(self, user_id: str, name: str, wear: str, amount: int):
+        """Добавляет скин или обновляет износ и количество существующего"""
+        user_id = str(user_id)
+        with self._lock:
+            inv = self._load_inventory(user_id)
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO inventory (user_id, name, wear, amount) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, name) DO UPDATE SET wear = excluded.wear, amount = excluded.amount",
+                    (user_id, name, wear, amount)
+                )
+            inv[name] = {"wear": wear, "amount": amount}
+
+    def delete_item(self, user_id: str, name: str) -> bool:
+        """Удаляет скин; возвращает False, если его не было"""
+        user_id = str(user_id)
+        with self._lock:
+            inv = self._load_inventory(user_id)
+            if name not in inv:
+                return False
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM inventory WHERE user_id = ? AND name = ?", (user_id, name))
+            del inv[name]
+            return True
+
+    def all_inventories(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Инвентари всех пользователей (для фоновых задач, не для обработчиков)"""
+        with self._lock:
+            rows = self._connect().execute("SELECT user_id, name, wear, amount FROM inventory ORDER BY rowid").fetchall()
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for user_id, name, wear, amount in rows:
+            result.setdefault(user_id, {})[name] = {"wear": wear, "amount": amount}
+        return result
+
+    # ---------- Настройки ----------
+    def get_settings(self, user_id: str) -> Dict[str, Any]:
+        user_id = str(user_id)
+        with self._lock:
+            settings = self._settings.get(user_id)
+            if settings is None:
+                row = self._connect().execute("SELECT data FROM settings WHERE user_id = ?", (user_id,)).fetchone()
+                settings = json.loads(row[0]) if row else {}
+                self._settings[user_id] = settings
+            return dict(settings)
+
+    def set_settings(self, user_id: str, settings: Dict[str, Any]):
+        user_id = str(user_id)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO settings (user_id, data) VALUES (?, ?)",
+                    (user_id, json.dumps(settings, ensure_ascii=False))
+                )
+            self._settings[user_id] = dict(settings)
+
+    def get_currency(self, user_id: str, default: str = "RUB") -> str:
+        return self.get_settings(user_id).get("currency", default)
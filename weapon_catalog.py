@@ -0,0 +1,219 @@
+# weapon_catalog.py
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+import metrics
+
+WEAPONS_DIR = "weapons"
+RESOLVED_MEMO_SIZE = 2048  # запомненных результатов поиска по названию (название вводится пользователем свободно)
+
+# Порядок категорий определяет приоритет при нечетком совпадении
+CATEGORIES = ["rifles", "pistols", "smgs", "knives", "gloves", "heavy", "shotguns", "snipers"]
+
+_lock = threading.Lock()
+_built = False
+_weapons_dir = WEAPONS_DIR
+_index: Dict[str, str] = {}                 # нормализованное имя -> путь к файлу
+_entries: List[Tuple[str, str]] = []        # (нормализованное имя, путь) в детерминированном порядке
+_resolved: "OrderedDict[str, Optional[str]]" = OrderedDict()  # запрос -> результат поиска (LRU, включая промахи)
+_files: Dict[str, Dict[str, Any]] = {}      # путь -> разобранный файл оружия
+_stats = {
+    "files": 0,
+    "categories": 0,
+    "builds": 0,
+    "build_time": 0.0,
+    "built_at": None,
+    "lookups": 0,
+    "memo_hits": 0,
+    "exact_hits": 0,
+    "fuzzy_hits": 0,
+    "misses": 0,
+    "memo_evictions": 0,
+    "file_hits": 0,
+    "file_loads": 0,
+    "file_errors": 0,
+}
+
+def normalize_weapon_name(name: str) -> str:
+    """Приводит название оружия к виду имени файла"""
+    return name.lower().replace(" ", "-").replace("|", "").replace("'", "").strip()
+
+def rebuild_index(weapons_dir: str = None) -> Dict[str, Any]:
+    """Перестраивает индекс файлов оружия (единственное место, где сканируется диск)"""
+    global _built, _weapons_dir, _index, _entries
+
+    if weapons_dir is not None:
+        _weapons_dir = weapons_dir
+
+    started = time.perf_counter()
+    index = {}
+    entries = []
+    categories = 0
+
+    for category in CATEGORIES:
+        category_path = os.path.join(_weapons_dir, category)
+        if not os.path.isdir(category_path):
+            continue
+        categories += 1
+
+        for filename in sorted(os.listdir(category_path)):
+            if not filename.endswith(".json"):
+                continue
+            file_weapon = normalize_weapon_name(filename[:-len(".json")])
+            path = os.path.join(category_path, filename)
+            entries.append((file_weapon, path))
+            # При дубликатах побеждает первая категория по порядку
+            index.setdefault(file_weapon, path)
+
+    # Индекс подменяется целиком: поиск вне блокировки читает прежний снимок
+    with _lock:
+        _index = index
+        _entries = entries
+        _resolved.clear()
+        _built = True
+        _stats["files"] = len(entries)
+        _stats["categories"] = categories
+        _stats["builds"] += 1
+        _stats["build_time"] = round(time.perf_counter() - started, 6)
+        _stats["built_at"] = time.time()
+
+    return get_stats()
+
+def ensure_index():
+    """Строит индекс при первом обращении"""
+    if not _built:
+        with _lock:
+            need_build = not _built
+        if need_build:
+            rebuild_index()
+
+def _resolve(weapon_name: str, index: Dict[str, str], entries: List[Tuple[str, str]]) -> Tuple[Optional[str], str]:
+    """Ищет файл по индексу: сначала точное совпадение, затем нечеткое"""
+    weapon_normalized = normalize_weapon_name(weapon_name)
+
+    path = index.get(weapon_normalized)
+    if path:
+        return path, "exact_hits"
+
+    weapon_lower = weapon_name.lower()
+    for file_weapon, path in entries:
+        if (weapon_normalized in file_weapon or
+            file_weapon in weapon_normalized or
+            weapon_lower in file_weapon):
+            return path, "fuzzy_hits"
+
+    return None, "misses"
+
+def find_weapon_file(weapon_name: str) -> Optional[str]:
+    """Возвращает путь к файлу оружия без обращения к диску"""
+    ensure_index()
+
+    with metrics.timed("find_weapon_file"):
+        with _lock:
+            _stats["lookups"] += 1
+            if weapon_name in _resolved:
+                _stats["memo_hits"] += 1
+                _resolved.move_to_end(weapon_name)
+                return _resolved[weapon_name]
+            index, entries, builds = _index, _entries, _stats["builds"]
+
+        # Нечеткий перебор идет без общей блокировки, чтобы не задерживать другие поиски
+        path, outcome = _resolve(weapon_name, index, entries)
+
+        with _lock:
+            _stats[outcome] += 1
+            # Результат по индексу, который успели перестроить, не запоминаем
+            if builds == _stats["builds"]:
+                _resolved[weapon_name] = path
+                while len(_resolved) > RESOLVED_MEMO_SIZE:
+                    _resolved.popitem(last=False)
+                    _stats["memo_evictions"] += 1
+        return path
+
+def get_stats() -> Dict[str, Any]:
+    """Статистика индекса"""
+    with _lock:
+        stats = dict(_stats)
+        stats["resolved"] = len(_resolved)
+        stats["cached_files"] = len(_files)
+        stats["weapons_dir"] = _weapons_dir
+    return stats
+
+# Кэш разобранных файлов оружия
+def _parse_weapon_file(path: str) -> Optional[Dict[str, Any]]:
+    """Читает файл оружия и строит словарь скинов по имени в нижнем регистре"""
+    try:
+        with metrics.timed("weapon_parse"), open(path, "r", encoding="utf-8") as f:
+            skins = json.load(f)
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return None
+
+    if not isinstance(skins, list):
+        skins = []
+
+    by_name = {}
+    names = []
+    for skin in skins:
+        skin_lower = skin.get("name", "").lower()
+        # Как и при линейном поиске, побеждает первый скин с таким именем
+        by_name.setdefault(skin_lower, skin)
+        names.append((skin_lower, skin))
+
+    return {"by_name": by_name, "names": names, "skins": skins}
+
+def load_weapon_file(path: str) -> Optional[Dict[str, Any]]:
+    """Возвращает разобранный файл оружия, перечитывая его только при изменении mtime/размера"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        with _lock:
+            _files.pop(path, None)
+        return None
+
+    signature = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _files.get(path)
+        if cached and cached["signature"] == signature:
+            _stats["file_hits"] += 1
+            return cached
+
+    parsed = _parse_weapon_file(path)
+    with _lock:
+        if parsed is None:
+            _stats["file_errors"] += 1
+            _files.pop(path, None)
+            return None
+        parsed["signature"] = signature
+        _files[path] = parsed
+        _stats["file_loads"] += 1
+    return parsed
+
+def find_skin(path: str, skin_input: str) -> Optional[Dict[str, Any]]:
+    """Ищет скин в файле: сначала точное совпадение имени, затем по подстроке"""
+    return find_skin_in(load_weapon_file(path), skin_input)
+
+def find_skin_in(weapon_data: Optional[Dict[str, Any]], skin_input: str) -> Optional[Dict[str, Any]]:
+    """Ищет скин в уже загруженном файле оружия"""
+    if not weapon_data:
+        return None
+
+    skin_lower = skin_input.lower()
+    skin = weapon_data["by_name"].get(skin_lower)
+    if skin is not None:
+        return skin
+
+    for name_lower, skin in weapon_data["names"]:
+        if skin_lower in name_lower:
+            return skin
+
+    return None
+
+def clear_file_cache():
+    """Сбрасывает кэш разобранных файлов"""
+    with _lock:
+        _files.clear()